@@ -0,0 +1,136 @@
+"""
+Admission control in front of the chatbot service
+
+Each provider gets a fixed number of concurrent request slots and a bounded
+FIFO wait queue. When the queue is full a request is rejected at once with
+429, and when it waits past the queue deadline it is rejected with 503, so
+overload shows up as fast, retryable errors instead of every request timing
+out together.
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+from .latency import LatencyHistogram
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away because its provider is saturated"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after  # Seconds, sent as the Retry-After header
+
+
+class ProviderLimiter:
+    """Concurrency slots for one provider with a bounded, deadline-limited wait queue"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int = 50, queue_timeout: float = 30.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_times = LatencyHistogram(min_seconds=0.001)
+        self.service_times = LatencyHistogram()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self):
+        """Wait for a slot, raising AdmissionRejected if the queue is full or the deadline passes"""
+        started = time.monotonic()
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending, so concurrent arrivals see it as gone
+            await self._semaphore.acquire()
+        elif self.queue_depth >= self.max_queue:
+            self.rejected_full += 1
+            raise AdmissionRejected(429, f"{self.name} is at capacity, please retry shortly", self.retry_after())
+        else:
+            self.queue_depth += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise AdmissionRejected(503, f"Timed out waiting for {self.name}", self.retry_after())
+            finally:
+                self.queue_depth -= 1
+
+        self.in_flight += 1
+        self.admitted += 1
+        self.wait_times.record(time.monotonic() - started)
+
+    def release(self, service_time: float):
+        """Free a slot and record how long it was held"""
+        self.in_flight -= 1
+        self.service_times.record(service_time)
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        """Estimate how long until the current queue drains, in whole seconds"""
+        mean_service = self.service_times.total / self.service_times.count if self.service_times.count else 1.0
+        return max(1, math.ceil((self.queue_depth + 1) * mean_service / self.max_concurrency))
+
+    def stats(self) -> Dict:
+        """Describe current load and admission counters"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_queue_timeout": self.rejected_timeout,
+            "wait_seconds": self.wait_times.snapshot(),
+            "service_seconds": self.service_times.snapshot()
+        }
+
+
+class AdmissionController:
+    """Admits requests into per-provider limiters"""
+
+    def __init__(self, limits: Dict[str, int], max_queue: int = 50, queue_timeout: float = 30.0):
+        self.limiters = {
+            name: ProviderLimiter(name, max_concurrency, max_queue=max_queue, queue_timeout=queue_timeout)
+            for name, max_concurrency in limits.items()
+            if max_concurrency > 0
+        }
+
+    async def acquire(self, provider: Optional[str]) -> Callable[[], None]:
+        """Take one of a provider's slots and return the function that gives it back
+
+        Providers without a limit are admitted at once.
+        """
+        limiter = self.limiters.get(provider)
+        if limiter is None:
+            return lambda: None
+        await limiter.acquire()
+        started = time.monotonic()
+        released = False
+        
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                limiter.release(time.monotonic() - started)
+        return release
+
+    @asynccontextmanager
+    async def admit(self, provider: Optional[str]):
+        """Hold one of a provider's slots for the duration of the block"""
+        release = await self.acquire(provider)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> Dict:
+        """Get the load and counters of every provider limiter"""
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
@@ -0,0 +1,89 @@
+"""
+Streaming parsers for bulk knowledge base imports
+"""
+
+import codecs
+import json
+from typing import AsyncIterator, Dict
+
+# Field names used by the single-item training endpoints, mapped to knowledge base entry fields
+FIELD_ALIASES = {
+    "userMsg": "user",
+    "assistantMsg": "assistant",
+    "traitValue": "value",
+}
+
+
+def normalize_entry(raw: Dict) -> Dict:
+    """Accept the same field names as the single-item /api/train endpoints"""
+    if not isinstance(raw, dict):
+        return {"type": None}
+    return {FIELD_ALIASES.get(key, key): value for key, value in raw.items()}
+
+
+async def iter_entries(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict]:
+    """Parse a request body holding either a JSON array or NDJSON, one entry at a time
+
+    The format is detected from the first non-whitespace character, and
+    entries are yielded as soon as they are complete, so the whole body is
+    never held in memory.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buffer = ""
+    body_format = None
+    array_closed = False
+    line_number = 0
+
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        if body_format is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            if stripped[0] == "[":
+                body_format = "array"
+                buffer = stripped[1:]
+            else:
+                body_format = "ndjson"
+
+        if body_format == "ndjson":
+            lines = buffer.split("\n")
+            buffer = lines.pop()
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    yield normalize_entry(_loads_line(line, line_number))
+            continue
+
+        # JSON array: decode complete objects and keep any partial tail for the next chunk
+        position = 0
+        while not array_closed:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                array_closed = True
+                position += 1
+                break
+            try:
+                entry, position = json_decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # Incomplete object; wait for more data
+            yield normalize_entry(entry)
+        buffer = buffer[position:]
+
+    buffer += decoder.decode(b"", final=True)
+    if body_format == "ndjson" and buffer.strip():
+        yield normalize_entry(_loads_line(buffer, line_number + 1))
+    elif body_format == "array" and (not array_closed or buffer.strip()):
+        raise ValueError("Malformed JSON array in request body")
+
+
+def _loads_line(line: str, line_number: int) -> Dict:
+    """Parse one NDJSON line"""
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON on line {line_number}: {e.msg}")
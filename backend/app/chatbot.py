@@ -1,20 +1,66 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import time
+import uuid
 import os
 import sys
+from fastapi.concurrency import run_in_threadpool
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from .models import ChatMessage, ChatRequest, ChatResponse
 from .llm_client import OllamaClient
 from .gemini_client import GeminiClient
-from config import LLM_PROVIDER, GEMINI_API_KEY, GEMINI_MODEL, OLLAMA_URL, OLLAMA_MODEL
+from .conversation_store import ConversationStore, create_conversation_store
+from .admission import AdmissionController
+from .response_cache import ResponseCache
+from .semantic_cache import SemanticCache
+from .prompt_builder import PromptBuilder
+from .provider_router import ProviderRouter
+from .errors import ProviderError
+from .health import HealthMonitor
+from .single_flight import Broadcast, SingleFlight
+from .text_processing import normalize_message
+from config import (
+    LLM_PROVIDER, GEMINI_API_KEY, GEMINI_MODEL, GEMINI_MAX_CONCURRENCY, OLLAMA_URL, OLLAMA_MODEL, OLLAMA_KEEP_ALIVE,
+    OLLAMA_CONTEXT_SESSIONS, OLLAMA_MAX_CONTEXT_TOKENS,
+    CONVERSATION_BACKEND, CONVERSATION_DB_PATH, CONVERSATION_MAX_SESSIONS, CONVERSATION_TTL_SECONDS,
+    MAX_CONVERSATION_HISTORY, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, RETRIEVAL_TOP_K, CONTEXT_TOKEN_BUDGET,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_BASE_BACKOFF_SECONDS, CIRCUIT_MAX_BACKOFF_SECONDS,
+    HEDGE_REQUESTS, HEDGE_PERCENTILE, HEDGE_MIN_DELAY_SECONDS, HEDGE_DEFAULT_DELAY_SECONDS,
+    HEALTH_CHECK_INTERVAL_SECONDS, HEALTH_CHECK_TIMEOUT_SECONDS
+)
 
 class ChatbotService:
     """Main chatbot service that handles conversation logic with intelligent fallback"""
     
-    def __init__(self, knowledge_base=None):
+    def __init__(self, knowledge_base=None, conversation_store: ConversationStore = None,
+                 admission: AdmissionController = None):
         self.knowledge_base = knowledge_base
-        self.conversation_history: List[ChatMessage] = []
+        self.admission = admission  # Limits concurrent provider calls; cached and coalesced answers skip it
+        self.conversation_store = conversation_store or create_conversation_store(
+            CONVERSATION_BACKEND,
+            db_path=CONVERSATION_DB_PATH,
+            max_sessions=CONVERSATION_MAX_SESSIONS,
+            max_messages=MAX_CONVERSATION_HISTORY,
+            ttl_seconds=CONVERSATION_TTL_SECONDS
+        )
+        self.response_cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_SIZE,
+            ttl_seconds=RESPONSE_CACHE_TTL_SECONDS
+        )
+        self.semantic_cache = SemanticCache(
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            max_entries=SEMANTIC_CACHE_SIZE,
+            ttl_seconds=RESPONSE_CACHE_TTL_SECONDS
+        )
+        
+        # Both clients share one prompt builder so the static prefix is built once per KB version
+        self.prompt_builder = PromptBuilder(
+            knowledge_base,
+            retrieval_top_k=RETRIEVAL_TOP_K,
+            context_token_budget=CONTEXT_TOKEN_BUDGET
+        ) if knowledge_base is not None else None
         
         # Initialize both clients for fallback capability
         self.gemini_client = None
@@ -26,7 +72,11 @@ class ChatbotService:
                 self.gemini_client = GeminiClient(
                     api_key=GEMINI_API_KEY,
                     model=GEMINI_MODEL,
-                    knowledge_base=knowledge_base
+                    knowledge_base=knowledge_base,
+                    max_concurrency=GEMINI_MAX_CONCURRENCY,
+                    retrieval_top_k=RETRIEVAL_TOP_K,
+                    context_token_budget=CONTEXT_TOKEN_BUDGET,
+                    prompt_builder=self.prompt_builder
                 )
             except Exception as e:
                 print(f"Failed to initialize Gemini client: {e}")
@@ -36,7 +86,13 @@ class ChatbotService:
             self.ollama_client = OllamaClient(
                 base_url=OLLAMA_URL,
                 model=OLLAMA_MODEL,
-                knowledge_base=knowledge_base
+                knowledge_base=knowledge_base,
+                retrieval_top_k=RETRIEVAL_TOP_K,
+                context_token_budget=CONTEXT_TOKEN_BUDGET,
+                prompt_builder=self.prompt_builder,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                context_sessions=OLLAMA_CONTEXT_SESSIONS,
+                max_context_tokens=OLLAMA_MAX_CONTEXT_TOKENS
             )
         except Exception as e:
             print(f"Failed to initialize Ollama client: {e}")
@@ -48,105 +104,282 @@ class ChatbotService:
         else:
             self.primary_client = self.ollama_client
             self.fallback_client = self.gemini_client
+        
+        # Route requests in priority order, skipping providers whose circuit is open
+        # and optionally hedging slow calls with the next provider
+        self.router = ProviderRouter(
+            [(self._provider_name(client), client) for client in (self.primary_client, self.fallback_client)],
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+            base_backoff=CIRCUIT_BASE_BACKOFF_SECONDS,
+            max_backoff=CIRCUIT_MAX_BACKOFF_SECONDS,
+            hedge=HEDGE_REQUESTS,
+            hedge_percentile=HEDGE_PERCENTILE,
+            hedge_min_delay=HEDGE_MIN_DELAY_SECONDS,
+            hedge_default_delay=HEDGE_DEFAULT_DELAY_SECONDS
+        )
+        
+        # Identical opening questions asked at the same time share one provider call
+        self.single_flight = SingleFlight()
+        
+        # Providers are probed in the background; health endpoints read the cached result
+        self.health_monitor = HealthMonitor(
+            self.router.providers,
+            interval_seconds=HEALTH_CHECK_INTERVAL_SECONDS,
+            timeout_seconds=HEALTH_CHECK_TIMEOUT_SECONDS
+        )
     
     async def process_message(self, request: ChatRequest) -> ChatResponse:
         """Process a user message and return chatbot response with intelligent fallback"""
         start_time = time.time()
         
-        # Add user message to history
         user_message = ChatMessage(
             role="user",
             content=request.message,
             timestamp=datetime.now()
         )
+        session_id, conversation_history = await self._run_store(self._start_turn, request, user_message)
         
-        # Add any provided conversation history
-        if request.conversation_history:
-            self.conversation_history = request.conversation_history
-        
-        self.conversation_history.append(user_message)
-        
-        # Try primary client first, then fallback if needed
-        response_text = await self._generate_response_with_fallback(
+        # Serve repeated questions from cache, otherwise try primary client then fallback
+        response_text = await self._generate_cached_response(
             request.message, 
-            self.conversation_history
+            conversation_history,
+            session_id
         )
         
-        # Add assistant response to history
+        # Add the turn to the caller's session
         assistant_message = ChatMessage(
             role="assistant",
             content=response_text,
             timestamp=datetime.now()
         )
-        self.conversation_history.append(assistant_message)
+        conversation_history = await self._run_store(self._record_turn, session_id, user_message, assistant_message)
         
         processing_time = time.time() - start_time
         
         return ChatResponse(
             response=response_text,
-            conversation_history=self.conversation_history,
+            conversation_history=conversation_history,
             model_used=getattr(self.primary_client, 'model_name', getattr(self.primary_client, 'model', 'unknown')),
-            processing_time=processing_time
+            processing_time=processing_time,
+            session_id=session_id
         )
     
-    async def _generate_response_with_fallback(self, message: str, conversation_history: List[ChatMessage]) -> str:
-        """Generate response with automatic fallback on quota/error"""
-        # Try primary client first
-        if self.primary_client:
-            try:
-                response = await self.primary_client.generate_response(message, conversation_history)
-                
-                # Check if response indicates quota exceeded
-                if "quota" in response.lower() and "exceeded" in response.lower():
-                    print("Primary client quota exceeded, trying fallback...")
-                    if self.fallback_client:
-                        return await self.fallback_client.generate_response(message, conversation_history)
-                    else:
-                        return "I'm currently experiencing high demand. Please try again later or contact support."
-                
-                return response
-                
-            except Exception as e:
-                print(f"Primary client error: {e}, trying fallback...")
-                if self.fallback_client:
-                    try:
-                        return await self.fallback_client.generate_response(message, conversation_history)
-                    except Exception as fallback_error:
-                        print(f"Fallback client also failed: {fallback_error}")
-                        return f"I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
-                else:
-                    return f"I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
+    async def stream_message(self, request: ChatRequest) -> AsyncIterator[Dict]:
+        """Process a user message and stream the response as token events"""
+        start_time = time.time()
         
-        # If no primary client, try fallback
-        elif self.fallback_client:
-            try:
-                return await self.fallback_client.generate_response(message, conversation_history)
-            except Exception as e:
-                return f"I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
+        user_message = ChatMessage(
+            role="user",
+            content=request.message,
+            timestamp=datetime.now()
+        )
+        session_id, conversation_history = await self._run_store(self._start_turn, request, user_message)
+        
+        chunks = []
+        tokens = self._stream_cached_response(request.message, conversation_history, session_id)
+        try:
+            async for token in tokens:
+                chunks.append(token)
+                yield {"type": "token", "content": token}
+        finally:
+            await tokens.aclose()  # Closing this stream closes the provider call and its admission slot with it
         
-        return "No LLM services are currently available. Please check your configuration."
+        assistant_message = ChatMessage(
+            role="assistant",
+            content="".join(chunks),
+            timestamp=datetime.now()
+        )
+        conversation_history = await self._run_store(self._record_turn, session_id, user_message, assistant_message)
+        
+        processing_time = time.time() - start_time
+        
+        # The final event carries the same payload as the non-streaming endpoint
+        response = ChatResponse(
+            response=assistant_message.content,
+            conversation_history=conversation_history,
+            model_used=getattr(self.primary_client, 'model_name', getattr(self.primary_client, 'model', 'unknown')),
+            processing_time=processing_time,
+            session_id=session_id
+        )
+        yield {"type": "done", **response.model_dump(mode="json")}
     
-    async def check_llm_health(self) -> bool:
-        """Check if any LLM service is available"""
-        if self.primary_client:
-            try:
-                if await self.primary_client.check_health():
-                    return True
-            except:
-                pass
+    async def _run_store(self, function, *args):
+        """Call a conversation store function, in a worker thread if the store blocks on I/O"""
+        if self.conversation_store.blocking:
+            return await run_in_threadpool(function, *args)
+        return function(*args)
+    
+    def _start_turn(self, request: ChatRequest, user_message: ChatMessage) -> Tuple[str, List[ChatMessage]]:
+        """Resolve the caller's session, seeding it with any client-held history, and get the turn's history
         
-        if self.fallback_client:
-            try:
-                return await self.fallback_client.check_health()
-            except:
-                pass
+        The history is the session's followed by the new message, which is
+        stored only once it has been answered. That way a turn rejected by
+        admission control leaves no unanswered message behind for the
+        client's retry to repeat.
+        """
+        session_id = request.session_id or uuid.uuid4().hex
+        if request.conversation_history:
+            self.conversation_store.set_history(session_id, request.conversation_history)
+        return session_id, self.conversation_store.get_history(session_id) + [user_message]
+    
+    def _record_turn(self, session_id: str, user_message: ChatMessage, assistant_message: ChatMessage) -> List[ChatMessage]:
+        """Store an answered turn and return the session's capped history"""
+        self.conversation_store.append(session_id, user_message)
+        return self.conversation_store.append(session_id, assistant_message)
+    
+    def _kb_version(self) -> int:
+        """Get the current knowledge base version used to key cached responses"""
+        return self.knowledge_base.version if self.knowledge_base else 0
+    
+    def _is_opening_turn(self, conversation_history: List[ChatMessage]) -> bool:
+        """Whether the answer depends only on the message, not on earlier turns"""
+        return len(conversation_history) <= 1
+    
+    def _is_cacheable_turn(self, conversation_history: List[ChatMessage]) -> bool:
+        """Only opening questions are cached, since later answers depend on earlier turns"""
+        caching_enabled = self.response_cache.enabled or self.semantic_cache.enabled
+        return caching_enabled and self._is_opening_turn(conversation_history)
+    
+    def _get_cached_response(self, message: str, kb_version: int) -> Optional[str]:
+        """Look up an exact match first, then a paraphrase in the semantic cache"""
+        cached_response = self.response_cache.get(message, kb_version)
+        if cached_response is None:
+            cached_response = self.semantic_cache.get(message, kb_version)
+            if cached_response is not None:
+                # Promote the paraphrase so the next identical question is an exact hit
+                self.response_cache.put(message, kb_version, cached_response)
+        return cached_response
+    
+    def _cache_response(self, message: str, kb_version: int, response_text: str):
+        """Store a successful response in both caches"""
+        if not response_text:
+            return
+        self.response_cache.put(message, kb_version, response_text)
+        self.semantic_cache.put(message, kb_version, response_text)
+    
+    async def _generate_cached_response(self, message: str, conversation_history: List[ChatMessage], session_id: Optional[str] = None) -> str:
+        """Generate a response, reusing a cached or in-flight answer for repeated opening questions"""
+        kb_version = self._kb_version()
+        if self._is_cacheable_turn(conversation_history):
+            cached_response = self._get_cached_response(message, kb_version)
+            if cached_response is not None:
+                return cached_response
+        
+        try:
+            if self._is_opening_turn(conversation_history):
+                return await self._join_flight(message, conversation_history, session_id, kb_version).result()
+            async with self._provider_slot():
+                return await self.router.generate(message, conversation_history, session_id)
+        except ProviderError as e:
+            # Error messages are shown to the user but never cached
+            print(f"No provider could answer: {e}")
+            return e.user_message
+    
+    async def _stream_cached_response(self, message: str, conversation_history: List[ChatMessage], session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream a response, replaying a cached answer or following an in-flight one for repeated opening questions"""
+        kb_version = self._kb_version()
+        if self._is_cacheable_turn(conversation_history):
+            cached_response = self._get_cached_response(message, kb_version)
+            if cached_response is not None:
+                yield cached_response
+                return
         
-        return False
+        if self._is_opening_turn(conversation_history):
+            tokens = self._join_flight(message, conversation_history, session_id, kb_version, stream=True).subscribe()
+        else:
+            tokens = self._admitted_stream(message, conversation_history, session_id)
+        
+        streamed = False
+        try:
+            async for token in tokens:
+                streamed = True
+                yield token
+        except ProviderError as e:
+            print(f"No provider could finish the stream: {e}")
+            yield f"\n\n{e.user_message}" if streamed else e.user_message
+        finally:
+            await tokens.aclose()  # Gives back the admission slot at once if the caller stops listening
+    
+    async def _admitted_stream(self, message: str, conversation_history: List[ChatMessage], session_id: Optional[str]) -> AsyncIterator[str]:
+        """Stream from the providers while holding an admission slot"""
+        async with self._provider_slot():
+            async for token in self.router.stream(message, conversation_history, session_id):
+                yield token
+    
+    @asynccontextmanager
+    async def _provider_slot(self):
+        """Hold an admission slot for the preferred provider around a real provider call
+        
+        Raises AdmissionRejected when the provider is saturated.
+        """
+        if self.admission is None:
+            yield
+            return
+        async with self.admission.admit(self.router.preferred_provider()):
+            yield
+    
+    def _join_flight(self, message: str, conversation_history: List[ChatMessage], session_id: Optional[str],
+                     kb_version: int, stream: bool = False) -> Broadcast:
+        """Attach to the in-flight generation of an opening question, starting one if there is none
+        
+        Streaming and non-streaming callers share flights; a flight started by a
+        streaming caller publishes tokens as they arrive, otherwise the whole
+        answer at once. The answer is cached once, when the flight succeeds.
+        """
+        cacheable = self._is_cacheable_turn(conversation_history)
+        
+        async def produce(broadcast: Broadcast):
+            # One slot per flight: callers that join it never queue for a provider
+            async with self._provider_slot():
+                if stream:
+                    async for token in self.router.stream(message, conversation_history, session_id):
+                        broadcast.publish(token)
+                else:
+                    broadcast.publish(await self.router.generate(message, conversation_history, session_id))
+            if cacheable:
+                self._cache_response(message, kb_version, "".join(broadcast.chunks))
+        
+        return self.single_flight.join((normalize_message(message), kb_version), produce)
+    
+    @staticmethod
+    def _provider_name(client) -> Optional[str]:
+        """Name a client for routing and diagnostics"""
+        if client is None:
+            return None
+        return "gemini" if isinstance(client, GeminiClient) else "ollama"
+    
+    async def check_llm_health(self) -> bool:
+        """Check if any LLM service is available, using the monitor's cached probes"""
+        if self.health_monitor.checked_at is None:
+            await self.health_monitor.check_now()
+        return self.health_monitor.healthy
+    
+    async def close(self):
+        """Release provider connections, thread pools and the conversation store"""
+        await self.health_monitor.stop()
+        for client in (self.gemini_client, self.ollama_client):
+            if client:
+                await client.close()
+        self.conversation_store.close()
+    
+    def set_system_prompt(self, system_prompt: str):
+        """Switch to a new system prompt, dropping cached answers written with the old one"""
+        builders = {id(builder): builder for builder in (
+            self.prompt_builder,
+            getattr(self.gemini_client, "prompt_builder", None),
+            getattr(self.ollama_client, "prompt_builder", None)
+        ) if builder is not None}
+        for builder in builders.values():
+            builder.system_prompt = system_prompt
+        self.response_cache.invalidate()
+        self.semantic_cache.invalidate()
     
-    def get_conversation_history(self) -> List[ChatMessage]:
-        """Get current conversation history"""
-        return self.conversation_history
+    def get_conversation_history(self, session_id: str) -> List[ChatMessage]:
+        """Get conversation history for a session"""
+        return self.conversation_store.get_history(session_id)
     
-    def clear_conversation(self):
-        """Clear conversation history"""
-        self.conversation_history = []
\ No newline at end of file
+    def clear_conversation(self, session_id: str):
+        """Clear conversation history for a session"""
+        self.conversation_store.clear(session_id)
+        if self.ollama_client:
+            self.ollama_client.forget_session(session_id)
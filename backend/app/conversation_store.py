@@ -0,0 +1,240 @@
+"""
+Session-keyed conversation storage for the chatbot
+"""
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Tuple
+
+from .models import ChatMessage
+
+
+class ConversationStore(ABC):
+    """Base class for per-session conversation history storage"""
+
+    # Stores doing blocking I/O are called from a worker thread rather than the event loop
+    blocking = False
+
+    def __init__(self, max_messages: int = 20, ttl_seconds: float = 3600):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def get_history(self, session_id: str) -> List[ChatMessage]:
+        """Get the conversation history for a session"""
+
+    @abstractmethod
+    def set_history(self, session_id: str, messages: List[ChatMessage]):
+        """Replace the conversation history for a session"""
+
+    @abstractmethod
+    def append(self, session_id: str, message: ChatMessage) -> List[ChatMessage]:
+        """Append a message to a session and return its capped history"""
+
+    @abstractmethod
+    def clear(self, session_id: str):
+        """Remove a session and its history"""
+
+    @abstractmethod
+    def session_count(self) -> int:
+        """Get the number of live sessions"""
+
+    def close(self):
+        """Release any resources held by the store"""
+        pass
+
+    def _cap(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        """Keep only the most recent messages allowed per session"""
+        if self.max_messages and len(messages) > self.max_messages:
+            return messages[-self.max_messages:]
+        return messages
+
+
+class InMemoryConversationStore(ConversationStore):
+    """In-process LRU store that evicts idle sessions after a TTL"""
+
+    def __init__(self, max_sessions: int = 1000, max_messages: int = 20, ttl_seconds: float = 3600):
+        super().__init__(max_messages=max_messages, ttl_seconds=ttl_seconds)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Tuple[float, List[ChatMessage]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_history(self, session_id: str) -> List[ChatMessage]:
+        with self._lock:
+            self._evict_expired()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def set_history(self, session_id: str, messages: List[ChatMessage]):
+        with self._lock:
+            self._store(session_id, self._cap(list(messages)))
+
+    def append(self, session_id: str, message: ChatMessage) -> List[ChatMessage]:
+        with self._lock:
+            self._evict_expired()
+            entry = self._sessions.get(session_id)
+            messages = entry[1] if entry else []
+            messages = self._cap(messages + [message])
+            self._store(session_id, messages)
+            return list(messages)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def session_count(self) -> int:
+        with self._lock:
+            self._evict_expired()
+            return len(self._sessions)
+
+    def _store(self, session_id: str, messages: List[ChatMessage]):
+        """Store a session as most recently used, evicting the oldest if full"""
+        self._sessions[session_id] = (time.monotonic(), messages)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _evict_expired(self):
+        """Drop sessions idle for longer than the TTL"""
+        if not self.ttl_seconds:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        # Sessions are ordered by last use, so expired ones are at the front
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if last_used >= cutoff:
+                break
+            del self._sessions[session_id]
+
+
+class SQLiteConversationStore(ConversationStore):
+    """SQLite-backed store, shared by every process using the same file"""
+
+    blocking = True  # Writes can wait up to the 30 second busy timeout on other processes
+
+    def __init__(self, db_path: str = "conversations.db", max_messages: int = 20, ttl_seconds: float = 3600):
+        super().__init__(max_messages=max_messages, ttl_seconds=ttl_seconds)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+        """)
+        self._conn.commit()
+
+    def get_history(self, session_id: str) -> List[ChatMessage]:
+        with self._lock:
+            self._evict_expired()
+            return self._read(session_id)
+
+    def set_history(self, session_id: str, messages: List[ChatMessage]):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            for message in self._cap(list(messages)):
+                self._insert(session_id, message)
+            self._touch(session_id)
+
+    def append(self, session_id: str, message: ChatMessage) -> List[ChatMessage]:
+        with self._lock:
+            with self._conn:
+                self._evict_expired()
+                self._insert(session_id, message)
+                self._trim(session_id)
+                self._touch(session_id)
+            return self._read(session_id)
+
+    def clear(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def session_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _read(self, session_id: str) -> List[ChatMessage]:
+        """Read a session's messages in insertion order"""
+        rows = self._conn.execute(
+            "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        ).fetchall()
+        return [ChatMessage(role=role, content=content, timestamp=timestamp) for role, content, timestamp in rows]
+
+    def _insert(self, session_id: str, message: ChatMessage):
+        """Insert a single message row"""
+        self._conn.execute(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            (session_id, message.role, message.content, message.timestamp.isoformat() if message.timestamp else None)
+        )
+
+    def _trim(self, session_id: str):
+        """Delete messages beyond the per-session cap"""
+        if not self.max_messages:
+            return
+        self._conn.execute(
+            """DELETE FROM messages WHERE session_id = ? AND id NOT IN (
+                   SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?
+               )""",
+            (session_id, session_id, self.max_messages)
+        )
+
+    def _touch(self, session_id: str):
+        """Record the session as recently used"""
+        self._conn.execute(
+            "INSERT INTO sessions (session_id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, time.time())
+        )
+
+    def _evict_expired(self):
+        """Delete sessions idle for longer than the TTL"""
+        if not self.ttl_seconds:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+
+
+def create_conversation_store(backend: str = "memory", **options) -> ConversationStore:
+    """Create a conversation store for the configured backend"""
+    if backend == "sqlite":
+        return SQLiteConversationStore(
+            db_path=options.get("db_path", "conversations.db"),
+            max_messages=options.get("max_messages", 20),
+            ttl_seconds=options.get("ttl_seconds", 3600)
+        )
+    if backend == "memory":
+        return InMemoryConversationStore(
+            max_sessions=options.get("max_sessions", 1000),
+            max_messages=options.get("max_messages", 20),
+            ttl_seconds=options.get("ttl_seconds", 3600)
+        )
+    raise ValueError(f"Unknown conversation store backend: {backend}")
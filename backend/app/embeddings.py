@@ -0,0 +1,75 @@
+"""
+Local CPU-only text embeddings for semantic matching
+"""
+
+import zlib
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from .text_processing import tokenize
+
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def _stem(token: str) -> str:
+    """Strip a common English suffix so word variants share features"""
+    for suffix in _SUFFIXES:
+        if len(token) > len(suffix) + 2 and token.endswith(suffix):
+            return token[:-len(suffix)]
+    return token
+
+
+class HashingEmbedder:
+    """Hashed TF-IDF embedder over word and character n-gram features"""
+
+    def __init__(self, dim: int = 1024, char_ngram: int = 3, word_weight: float = 1.0, char_weight: float = 0.5):
+        self.dim = dim
+        self.char_ngram = char_ngram
+        self.word_weight = word_weight
+        self.char_weight = char_weight
+        self.idf: Optional[np.ndarray] = None
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts into an (n, dim) float32 matrix of unit vectors"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, weight in self._features(text).items():
+                matrix[row, bucket] += weight
+        if self.idf is not None:
+            matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed_one(self, text: str) -> np.ndarray:
+        """Embed a single text into a unit vector"""
+        return self.embed([text])[0]
+
+    def fit_idf(self, texts: Iterable[str]):
+        """Weight hashed features by inverse document frequency over a corpus"""
+        document_frequency = np.zeros(self.dim, dtype=np.float32)
+        count = 0
+        for text in texts:
+            buckets = list(self._features(text))
+            document_frequency[buckets] += 1
+            count += 1
+        self.idf = (np.log((1 + count) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    def _features(self, text: str) -> Dict[int, float]:
+        """Hash word and character n-gram features into sublinear term weights"""
+        counts: Dict[int, float] = {}
+        for token in tokenize(text):
+            token = _stem(token)
+            self._add(counts, "w:" + token, self.word_weight)
+            padded = f"#{token}#"
+            for i in range(max(1, len(padded) - self.char_ngram + 1)):
+                self._add(counts, "c:" + padded[i:i + self.char_ngram], self.char_weight)
+        return {bucket: np.sign(weight) * np.log1p(abs(weight)) for bucket, weight in counts.items()}
+
+    def _add(self, counts: Dict[int, float], feature: str, weight: float):
+        """Add a feature's weight to its hashed bucket, using a hash bit as the sign"""
+        hashed = zlib.crc32(feature.encode("utf-8"))
+        bucket = hashed % self.dim
+        sign = 1.0 if (hashed >> 31) & 1 else -1.0
+        counts[bucket] = counts.get(bucket, 0.0) + sign * weight
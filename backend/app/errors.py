@@ -0,0 +1,44 @@
+"""
+Typed errors raised by the LLM clients and the provider router
+"""
+
+from typing import Optional
+
+
+class ProviderError(Exception):
+    """A provider could not produce a response"""
+
+    # Shown to the user when no provider can answer
+    user_message = "I'm experiencing technical difficulties. Please try again later."
+
+    def __init__(self, provider: str, detail: str, retry_after: Optional[float] = None):
+        super().__init__(f"{provider}: {detail}")
+        self.provider = provider
+        self.detail = detail
+        self.retry_after = retry_after  # Seconds the provider asked us to wait, if it said
+
+
+class QuotaExceededError(ProviderError):
+    """The provider rejected the request because a rate limit or quota was hit"""
+
+    user_message = "I'm currently experiencing high demand. Please try again later or contact support."
+
+
+class ProviderUnavailableError(ProviderError):
+    """The provider could not be reached or returned a server error"""
+
+
+class ProviderTimeoutError(ProviderError):
+    """The provider did not respond in time"""
+
+    user_message = "I'm taking a bit longer to respond. Please try again in a moment."
+
+
+class ProviderResponseError(ProviderError):
+    """The provider answered with an error or a response that could not be used"""
+
+
+class NoProviderAvailableError(ProviderError):
+    """No provider is configured, or every provider's circuit is open"""
+
+    user_message = "No LLM services are currently available. Please check your configuration."
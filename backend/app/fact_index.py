@@ -0,0 +1,126 @@
+"""
+Hashed index for detecting duplicate and near-duplicate facts
+"""
+
+import hashlib
+import zlib
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from .text_processing import normalize_message
+
+# Largest 32-bit prime, so (a * hash + b) never overflows uint64
+_PRIME = 4294967291
+
+
+def content_hash(text: str) -> str:
+    """Hash a fact after normalizing case, punctuation and whitespace"""
+    return hashlib.blake2b(normalize_message(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class FactIndex:
+    """Content-hash lookup for exact duplicates plus MinHash LSH for similar facts
+
+    Each fact is reduced to word shingles whose MinHash signature is split
+    into bands. Facts sharing a band bucket are candidates, and a candidate
+    only counts as similar if its shingle Jaccard similarity reaches the
+    threshold. Similar facts are often corrections ("$199" replacing "$99"),
+    so only exact duplicates should be rejected.
+    """
+
+    def __init__(self, shingle_size: int = 3, num_perm: int = 32, bands: int = 8, threshold: float = 0.8):
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+        self._facts: Dict[str, str] = {}  # content hash -> fact
+        self._band_keys: Dict[str, List[str]] = {}  # content hash -> LSH band keys
+        self._buckets: Dict[str, Set[str]] = {}  # band key -> content hashes
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def find_duplicate(self, fact: str) -> Optional[str]:
+        """Return the stored fact that equals the given one after normalization"""
+        return self._facts.get(content_hash(fact))
+
+    def find_similar(self, fact: str) -> Optional[str]:
+        """Return a stored fact that nearly duplicates the given one without being equal to it"""
+        fact_hash = content_hash(fact)
+        shingles = self._shingles(fact)
+        candidates = set()
+        for key in self._lsh_keys(shingles):
+            candidates.update(self._buckets.get(key, ()))
+        candidates.discard(fact_hash)
+        for candidate_hash in candidates:
+            candidate = self._facts[candidate_hash]
+            candidate_shingles = self._shingles(candidate)
+            similarity = len(shingles & candidate_shingles) / len(shingles | candidate_shingles)
+            if similarity >= self.threshold:
+                return candidate
+        return None
+
+    def add(self, fact: str, fact_hash: str = None, band_keys: List[str] = None):
+        """Index a fact, optionally with a precomputed hash and band keys"""
+        fact_hash = fact_hash or content_hash(fact)
+        if band_keys is None:
+            band_keys = self._lsh_keys(self._shingles(fact))
+        self._facts[fact_hash] = fact
+        self._band_keys[fact_hash] = band_keys
+        for key in band_keys:
+            self._buckets.setdefault(key, set()).add(fact_hash)
+
+    def remove(self, fact: str):
+        """Remove a fact from the index"""
+        fact_hash = content_hash(fact)
+        if self._facts.pop(fact_hash, None) is None:
+            return
+        for key in self._band_keys.pop(fact_hash, ()):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(fact_hash)
+                if not bucket:
+                    del self._buckets[key]
+
+    def clear(self):
+        """Remove every fact"""
+        self._facts.clear()
+        self._band_keys.clear()
+        self._buckets.clear()
+
+    def to_entries(self, facts: List[str]) -> List[List]:
+        """Serialize the hash and band keys of each fact, in the given order"""
+        entries = []
+        for fact in facts:
+            fact_hash = content_hash(fact)
+            entries.append([fact_hash, self._band_keys.get(fact_hash) or self._lsh_keys(self._shingles(fact))])
+        return entries
+
+    def load_entries(self, facts: List[str], entries: List[List]):
+        """Restore the index from serialized entries aligned with the facts list"""
+        if len(entries) != len(facts):
+            raise ValueError("Fact index does not match the stored facts")
+        self.clear()
+        for fact, (fact_hash, band_keys) in zip(facts, entries):
+            self.add(fact, fact_hash, band_keys)
+
+    def _shingles(self, text: str) -> Set[str]:
+        """Split normalized text into overlapping word shingles"""
+        words = normalize_message(text).split()
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def _lsh_keys(self, shingles: Set[str]) -> List[str]:
+        """Compute the MinHash signature and return one bucket key per band"""
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        signature = ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1)
+        rows = self.num_perm // self.bands
+        return [
+            f"{band}:{zlib.crc32(signature[band * rows:(band + 1) * rows].tobytes()):08x}"
+            for band in range(self.bands)
+        ]
@@ -1,92 +1,129 @@
 import google.generativeai as genai
-from typing import List, Optional
+from google.api_core import exceptions as google_exceptions
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional
 from .models import ChatMessage
 from .knowledge_base import KnowledgeBase
-import sys
+from .prompt_builder import PromptBuilder
+from .errors import (
+    ProviderError, ProviderResponseError, ProviderTimeoutError, ProviderUnavailableError, QuotaExceededError
+)
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from business_config import SYSTEM_PROMPT_TEMPLATE
 
 class GeminiClient:
     """Client for interacting with Google Gemini AI"""
     
-    def __init__(self, api_key: str = None, model: str = "gemini-1.5-flash", knowledge_base: KnowledgeBase = None):
+    def __init__(self, api_key: str = None, model: str = "gemini-1.5-flash", knowledge_base: KnowledgeBase = None, max_concurrency: int = 8,
+                 retrieval_top_k: int = 5, context_token_budget: int = 1500, prompt_builder: PromptBuilder = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         self.model_name = model
         self.knowledge_base = knowledge_base or KnowledgeBase()
+        self.prompt_builder = prompt_builder or PromptBuilder(
+            self.knowledge_base,
+            retrieval_top_k=retrieval_top_k,
+            context_token_budget=context_token_budget
+        )
+        
+        # The SDK calls are blocking, so they run on a bounded thread pool
+        # and the semaphore caps how many generations are in flight at once
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
         
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         
         # Configure Gemini
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel(self.model_name)
+        self._prompt_model = None
+        self._system_instruction = None
     
-    async def generate_response(self, message: str, conversation_history: List[ChatMessage] = None) -> str:
-        """Generate a response using Google Gemini"""
+    async def generate_response(self, message: str, conversation_history: List[ChatMessage] = None, session_id: Optional[str] = None) -> str:
+        """Generate a response using Google Gemini, raising ProviderError on failure"""
+        # Check if we have a trained answer for this question
+        trained_answer = self.knowledge_base.get_answer(message)
+        if trained_answer:
+            return trained_answer
+        
         try:
-            # Check if we have a trained answer for this question
-            trained_answer = self.knowledge_base.get_answer(message)
-            if trained_answer:
-                return trained_answer
-            
-            # Build the context
-            context = self._build_context(message, conversation_history)
-            
-            # Generate response
-            response = self.model.generate_content(context)
-            return response.text
+            model = self._model_for_prefix()
+            prompt = self.prompt_builder.suffix(message, conversation_history)
             
+            # Generate response without blocking the event loop
+            async with self._semaphore:
+                response = await self._run_blocking(model.generate_content, prompt)
+                return response.text
         except Exception as e:
-            return f"I encountered an issue: {str(e)}. Please try again."
+            raise self._provider_error(e) from e
     
-    def _build_context(self, message: str, conversation_history: List[ChatMessage] = None) -> str:
-        """Build context from conversation history and knowledge base"""
-        context = SYSTEM_PROMPT_TEMPLATE + "\n\n"
-        
-        # Add personality traits
-        personality_traits = self.knowledge_base.get_personality_traits()
-        if personality_traits:
-            context += "PERSONALITY TRAITS:\n"
-            for trait, value in personality_traits.items():
-                context += f"- {trait}: {value}\n"
-            context += "\n"
-        
-        # Add relevant facts
-        facts = self.knowledge_base.get_facts()
-        if facts:
-            context += "IMPORTANT FACTS:\n"
-            for fact in facts:
-                context += f"- {fact}\n"
-            context += "\n"
-        
-        # Add example conversations for context
-        examples = self.knowledge_base.get_example_conversations()
-        if examples:
-            context += "EXAMPLE CONVERSATIONS:\n"
-            for example in examples[-3:]:  # Use last 3 examples
-                context += f"User: {example['user']}\nAssistant: {example['assistant']}\n\n"
+    async def stream_response(self, message: str, conversation_history: List[ChatMessage] = None, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream a response from Google Gemini as chunks arrive, raising ProviderError on failure"""
+        # Trained answers are returned in a single chunk
+        trained_answer = self.knowledge_base.get_answer(message)
+        if trained_answer:
+            yield trained_answer
+            return
         
-        # Add conversation history if available
-        if conversation_history:
-            context += "CONVERSATION HISTORY:\n"
-            for msg in conversation_history[-6:]:  # Last 6 messages
-                role = "User" if msg.role == "user" else "Assistant"
-                context += f"{role}: {msg.content}\n"
-            context += "\n"
+        try:
+            model = self._model_for_prefix()
+            prompt = self.prompt_builder.suffix(message, conversation_history)
+            
+            async with self._semaphore:
+                response = await self._run_blocking(model.generate_content, prompt, stream=True)
+                
+                # Each chunk is pulled from the blocking iterator on the thread pool
+                chunks = iter(response)
+                while True:
+                    chunk = await self._run_blocking(next, chunks, None)
+                    if chunk is None:
+                        break
+                    if chunk.parts:
+                        yield chunk.text
+        except Exception as e:
+            raise self._provider_error(e) from e
+    
+    @staticmethod
+    def _provider_error(error: Exception) -> ProviderError:
+        """Map a Gemini SDK exception to a typed provider error"""
+        if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return QuotaExceededError("gemini", str(error))
+        if isinstance(error, (google_exceptions.DeadlineExceeded, asyncio.TimeoutError)):
+            return ProviderTimeoutError("gemini", str(error) or "request timed out")
+        if isinstance(error, (google_exceptions.ServerError, google_exceptions.RetryError, ConnectionError)):
+            return ProviderUnavailableError("gemini", str(error))
+        # Blocked prompts, invalid arguments and unreadable responses
+        return ProviderResponseError("gemini", str(error) or type(error).__name__)
+    
+    def _model_for_prefix(self):
+        """Get a model carrying the cached prompt prefix as its system instruction
         
-        context += f"Please respond to: {message}"
-        return context
+        The model is only recreated when the prefix changes. Gemini's explicit
+        context caching needs a prefix of tens of thousands of tokens, far more
+        than the system prompt and personality, so the system instruction is used.
+        """
+        prefix = self.prompt_builder.prefix()
+        if prefix is not self._system_instruction:
+            self._prompt_model = genai.GenerativeModel(self.model_name, system_instruction=prefix)
+            self._system_instruction = prefix
+        return self._prompt_model
     
     async def check_health(self) -> bool:
         """Check if Gemini service is available"""
         try:
-            # Simple test request
-            test_response = self.model.generate_content("Hello")
-            return test_response.text is not None
+            # A metadata lookup proves the key and model work without spending generation quota
+            name = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+            model_info = await self._run_blocking(genai.get_model, name)
+            return "generateContent" in model_info.supported_generation_methods
         except:
             return False
     
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking SDK call on the client's thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
     async def close(self):
-        """Close any resources (Gemini doesn't need explicit closing)"""
-        pass
+        """Shut down the thread pool used for SDK calls"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,81 @@
+"""
+Background health monitoring of the LLM providers
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class HealthMonitor:
+    """Probes each provider on a schedule and caches the results
+
+    Health endpoints read the cache instead of calling providers, so a load
+    balancer can poll as often as it likes without spending quota or
+    blocking requests.
+    """
+
+    def __init__(self, providers: List[Tuple[str, object]], interval_seconds: float = 30.0, timeout_seconds: float = 5.0):
+        self.providers = [(name, client) for name, client in providers if client is not None]
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.checked_at: Optional[datetime] = None
+        self._results: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def healthy(self) -> bool:
+        """Whether any provider passed its last probe"""
+        return any(result["healthy"] for result in self._results.values())
+
+    def status(self) -> Dict[str, Dict]:
+        """Get the last probe result of each provider"""
+        return {name: dict(result) for name, result in self._results.items()}
+
+    async def check_now(self):
+        """Probe every provider concurrently and update the cache"""
+        results = await asyncio.gather(*(self._probe(name, client) for name, client in self.providers))
+        self._results = dict(zip((name for name, _ in self.providers), results))
+        self.checked_at = datetime.now()
+
+    def start(self):
+        """Start probing in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background probes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Probe forever, sleeping between rounds"""
+        while True:
+            try:
+                await self.check_now()
+            except Exception as e:
+                print(f"Health check round failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def _probe(self, name: str, client) -> Dict:
+        """Run one provider's health check with a timeout"""
+        started = time.monotonic()
+        error = None
+        try:
+            healthy = await asyncio.wait_for(client.check_health(), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            healthy, error = False, f"no answer within {self.timeout_seconds}s"
+        except Exception as e:
+            healthy, error = False, str(e)
+        return {
+            "healthy": bool(healthy),
+            "latency": round(time.monotonic() - started, 3),
+            "checked_at": datetime.now().isoformat(),
+            "error": error
+        }
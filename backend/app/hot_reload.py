@@ -0,0 +1,148 @@
+"""
+Hot reload of the knowledge base snapshot and the business configuration
+
+The snapshot file and business_config.py are polled for changes. A changed
+snapshot is loaded into a separate knowledge base on a worker thread and
+swapped in with one step, so requests keep being served from the previous
+version until the new one is fully indexed.
+"""
+
+import asyncio
+import importlib
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from .knowledge_base import KnowledgeBase
+from .shared_files import file_stamp
+
+
+class HotReloader:
+    """Watches the knowledge base and business_config.py and reloads them in the background"""
+
+    def __init__(self, knowledge_base: KnowledgeBase, on_system_prompt: Callable[[str], None],
+                 interval_seconds: float = 2.0, config_module: str = "business_config"):
+        self.knowledge_base = knowledge_base
+        self.on_system_prompt = on_system_prompt  # Receives SYSTEM_PROMPT_TEMPLATE after a config reload
+        self.interval_seconds = interval_seconds
+        self.config_module = importlib.import_module(config_module)
+        self.reloads = 0
+        self.reloaded_at: Optional[datetime] = None
+        self.reload_seconds: Optional[float] = None  # Time the last knowledge base reload took
+        self.config_reloaded_at: Optional[datetime] = None
+        self.knowledge_error: Optional[str] = None  # Why the last knowledge base reload failed
+        self.config_error: Optional[str] = None
+        self._config_stamp = file_stamp(self.config_module.__file__)
+        self._failed_stamp = None  # Snapshot that failed to load, not retried until it changes again
+        self._wake = asyncio.Event()
+        self._reloading: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start watching in the background"""
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop watching"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Check for changes now instead of at the next interval"""
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        """Whether changes are being watched for in the background"""
+        return self._task is not None
+
+    async def check_now(self, force: bool = False):
+        """Reload whatever changed on disk, or everything with force"""
+        await self.check_knowledge(force)
+        if force or file_stamp(self.config_module.__file__) != self._config_stamp:
+            self.reload_config()
+
+    async def check_knowledge(self, force: bool = False):
+        """Reload the knowledge base if its snapshot changed, skipping a snapshot that already failed to load"""
+        snapshot_changed = self.knowledge_base.snapshot_changed() and \
+            file_stamp(self.knowledge_base.file_path) != self._failed_stamp
+        if force or snapshot_changed:
+            await self.reload_knowledge()
+
+    async def reload_knowledge(self):
+        """Load the knowledge base on a worker thread and swap it in, sharing a reload already under way"""
+        if self._reloading is None:
+            self._reloading = asyncio.ensure_future(self._reload_knowledge())
+            self._reloading.add_done_callback(self._reload_done)
+        await asyncio.shield(self._reloading)
+
+    def _reload_done(self, _):
+        """Allow the next reload to start"""
+        self._reloading = None
+
+    async def _reload_knowledge(self):
+        """Build (and if edited, publish) a fresh copy off the event loop, then switch to it in one step"""
+        started = time.monotonic()
+        stamp = file_stamp(self.knowledge_base.file_path)
+        try:
+            loop = asyncio.get_running_loop()
+            copy = await loop.run_in_executor(None, self.knowledge_base.load_copy)
+            # Waits for this process's writers, so it runs off the event loop too
+            await loop.run_in_executor(None, self.knowledge_base.swap, copy)
+        except Exception as e:
+            self._failed_stamp = stamp
+            self.knowledge_error = str(e)
+            print(f"Knowledge base reload failed: {e}")
+            return
+        self._failed_stamp = None
+        self.reloads += 1
+        self.reloaded_at = datetime.now()
+        self.reload_seconds = round(time.monotonic() - started, 3)
+        self.knowledge_error = None
+        print(f"Knowledge base reloaded at version {self.knowledge_base.version} in {self.reload_seconds}s")
+
+    def reload_config(self):
+        """Re-import business_config.py and hand its system prompt on, keeping the old one if it fails to import"""
+        self._config_stamp = file_stamp(self.config_module.__file__)
+        try:
+            self.config_module = importlib.reload(self.config_module)
+            self.on_system_prompt(self.config_module.SYSTEM_PROMPT_TEMPLATE)
+        except Exception as e:
+            self.config_error = str(e)
+            print(f"Business config reload failed: {e}")
+            return
+        self.config_reloaded_at = datetime.now()
+        self.config_error = None
+        print("Business config reloaded")
+
+    def status(self) -> Dict:
+        """Describe the active knowledge base version and the last reloads"""
+        return {
+            "version": self.knowledge_base.version,
+            "reloads": self.reloads,
+            "reloaded_at": self.reloaded_at.isoformat() if self.reloaded_at else None,
+            "reload_seconds": self.reload_seconds,
+            "reloading": self._reloading is not None,
+            "knowledge_error": self.knowledge_error,
+            "config_reloaded_at": self.config_reloaded_at.isoformat() if self.config_reloaded_at else None,
+            "config_error": self.config_error
+        }
+
+    async def _run(self):
+        """Poll for changes forever, waking early when asked"""
+        while True:
+            try:
+                await self.check_now()
+            except Exception as e:
+                print(f"Hot reload check failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
@@ -0,0 +1,37 @@
+"""
+Connection-pooled HTTP clients for the LLM providers
+"""
+
+import httpx
+
+
+def http2_available() -> bool:
+    """Check whether the optional h2 package needed for HTTP/2 is installed"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client(connect_timeout: float = 5.0, read_timeout: float = 120.0, pool_timeout: float = 10.0,
+                       max_connections: int = 20, max_keepalive_connections: int = 10,
+                       keepalive_expiry: float = 30.0, http2: bool = False) -> httpx.AsyncClient:
+    """Create an async client with explicit timeouts and a bounded, keep-alive connection pool
+
+    The read timeout applies between received chunks, so a long streamed
+    answer is fine while a stalled backend is cut off. Requests wait at most
+    pool_timeout for a free connection instead of piling up behind a slow one.
+    """
+    if http2 and not http2_available():
+        print("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(connect=connect_timeout, read=read_timeout, write=connect_timeout, pool=pool_timeout),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        ),
+        http2=http2
+    )
@@ -1,42 +1,559 @@
 """
 Knowledge Base for ChatBot Training
+
+Changes are appended to a journal file next to the JSON snapshot and
+replayed on load. The journal is periodically compacted back into the
+snapshot with an atomic rename, so a crash never leaves a half-written
+knowledge base behind.
+
+Several processes (e.g. uvicorn workers) can share one knowledge base:
+writes and compaction hold an exclusive file lock and first catch up with
+the other processes' changes, and refresh() tails the journal (or reloads
+after another process compacted) so every process converges on the same
+sequence-numbered version. A compaction starts the new journal with a
+marker holding the snapshot's sequence number, so a process that has not
+loaded that snapshot still numbers its changes after it.
+
+Edits made by hand to the snapshot are told apart from compactions by a
+digest stored in its metadata. load_copy() and swap() let a running server
+load such a snapshot off the request path and switch to it in one step.
+
+Within a process, writes may run on worker threads: they take a thread lock
+before the file lock. Reads share a second lock with the in-memory part of
+a write, which is held only briefly, never for fsync or compaction.
 """
 
+import functools
+import hashlib
 import json
 import os
-from typing import Dict, List, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import deepcopy
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .fact_index import FactIndex
+from .passages import PassageStore
+from .shared_files import FileLock, file_stamp
+from .vector_index import VectorIndex
+from .search_index import BM25Index
+from .text_processing import estimate_tokens
+
+# Knowledge types that are indexed for ranked search
+SEARCH_KINDS = ("qa", "fact", "example")
+
+# Required fields for each entry type accepted by add_entries
+ENTRY_FIELDS = {
+    "qa": ("question", "answer"),
+    "fact": ("fact",),
+    "example": ("user", "assistant"),
+    "personality": ("trait", "value"),
+}
+
+# Knowledge types embedded in the vector index
+VECTOR_KINDS = ("qa", "fact", "passage")
+
+# Rank offset for reciprocal rank fusion of lexical and vector results
+RRF_K = 60
+
+# One background thread embeds new items and compacts journals for every knowledge base in the process
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="knowledge-base")
+
+# Reserved snapshot key holding storage metadata; never part of self.knowledge
+META_KEY = "_meta"
+
+# Journal operation that opens every compacted journal, carrying the snapshot's sequence number
+SNAPSHOT_OP = "snapshot"
+
+# Attributes holding the loaded data and its search indexes, replaced together by swap()
+STATE_ATTRIBUTES = (
+    "knowledge", "passages", "_indexes", "_fact_index", "_example_keys", "_snapshot_seq", "_journal_seq",
+    "_disk_seq", "_journal_entries", "_journal_offset", "_journal_head", "_journal_stamp", "_snapshot_stamp",
+    "snapshot_edited"
+)
+
+def _digest(knowledge: Dict) -> str:
+    """Fingerprint snapshot contents, so a hand edit can be told apart from a compaction"""
+    return hashlib.sha256(json.dumps(knowledge, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _journal_head(f) -> Optional[int]:
+    """Sequence number of a journal's first entry, which tells a compacted journal apart from the one before"""
+    try:
+        return json.loads(f.readline())["seq"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def _report_vector_sync(sync: Future):
+    """Log a background vector index update that failed"""
+    if not sync.cancelled() and sync.exception() is not None:
+        print(f"Vector index update failed: {sync.exception()}")
+
+def _reading(method):
+    """Run a read under the state lock, so a writer on another thread never changes the data halfway through it"""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._state_lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+def _empty_knowledge() -> Dict:
+    """Create an empty knowledge structure"""
+    return {
+        "qa_pairs": {},  # Question-Answer pairs
+        "personality": {},  # Personality traits
+        "examples": [],  # Example conversations
+        "facts": []  # General facts about the user or topics
+    }
 
 class KnowledgeBase:
     """Simple knowledge base for storing and retrieving training data"""
     
-    def __init__(self, file_path: str = "knowledge_base.json"):
+    def __init__(self, file_path: str = "knowledge_base.json", compact_threshold: int = 1000, fsync: bool = True,
+                 passages_path: Optional[str] = None, vector_search: bool = True, verify_snapshot: bool = False,
+                 hot_reload: bool = False):
         self.file_path = file_path
-        self.knowledge = self._load_knowledge()
+        self.journal_path = file_path + ".journal"
+        self.fact_index_path = file_path + ".facts"
+        self._lock = FileLock(file_path + ".lock")
+        self._write_lock = threading.RLock()  # Serializes this process's writers; FileLock nesting is not thread-safe
+        self._state_lock = threading.RLock()  # Held by readers, and by writers while the data in memory changes
+        self._compaction: Optional[Future] = None  # Background compaction, if one is queued or running
+        self.passages = PassageStore(passages_path or os.path.splitext(file_path)[0] + "_passages.jsonl")
+        self.vectors = VectorIndex(file_path + ".vectors") if vector_search else None
+        self._vector_sync: Optional[Future] = None  # Background update of the vector index, if one is running
+        self.compact_threshold = compact_threshold  # Journal entries before folding into the snapshot
+        self.fsync = fsync
+        self.hot_reload = hot_reload  # A HotReloader swaps in replaced snapshots, so writes only replay the journal
+        self._snapshot_seq = 0  # Sequence number of the last change included in the snapshot
+        self._journal_seq = 0  # Sequence number of the last change applied in memory
+        self._disk_seq = 0  # Sequence number of the last change on disk, which new changes follow
+        self._journal_entries = 0
+        self._journal_offset = 0  # Bytes of the journal already applied
+        self._journal_head = None  # First sequence number of the journal the offset belongs to
+        self._journal_stamp = None  # Stamp of the journal file when it was last replayed
+        self._snapshot_stamp = None  # Stamp of the snapshot file as last read or written
+        self.snapshot_edited = False  # The loaded snapshot does not match its digest
+        self._pending: Optional[List[str]] = None  # Journal lines buffered by batch()
+        self._indexes = {kind: BM25Index() for kind in SEARCH_KINDS}
+        # Loading takes no lock, so writers never wait for it; a snapshot
+        # replaced while it was being read is just read again
+        for _ in range(3):
+            self._load(verify=verify_snapshot)
+            if not self.snapshot_changed():
+                break
+        else:
+            with self._lock.shared():
+                self._load(verify=verify_snapshot)
+    
+    def _load(self, verify: bool = False):
+        """Load the snapshot and indexes, then replay the journal on top
+        
+        With verify, a snapshot without a digest counts as edited by hand.
+        """
+        self._example_keys = set()
+        self._fact_index = FactIndex()
+        self._journal_entries = 0
+        self._journal_offset = 0
+        self._journal_head = None
+        self._journal_stamp = None
+        self.snapshot_edited = False
+        self.knowledge = self._load_knowledge(verify)
+        self._build_indexes(rebuild_fact_index=not self._load_fact_index())
+        self._replay_journal(loading=True)
+    
+    @property
+    def version(self) -> int:
+        """Bumped on every change, including saved passages, so caches can tell stale entries apart"""
+        return self._journal_seq + self.passages.revision
     
-    def _load_knowledge(self) -> Dict:
-        """Load knowledge base from file"""
-        if os.path.exists(self.file_path):
+    def _load_knowledge(self, verify: bool = False) -> Dict:
+        """Load knowledge base snapshot from file"""
+        knowledge = _empty_knowledge()
+        self._snapshot_stamp = file_stamp(self.file_path)
+        if self._snapshot_stamp is not None:
             try:
                 with open(self.file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    data = json.load(f)
+                meta = data.pop(META_KEY, {})
+                knowledge.update(data)
+                self._snapshot_seq = meta.get("journal_seq", 0)
+                self.snapshot_edited = False
+                if meta.get("digest") or verify:
+                    self.snapshot_edited = meta.get("digest") != _digest(knowledge)
             except:
-                pass
-        return {
-            "qa_pairs": {},  # Question-Answer pairs
-            "personality": {},  # Personality traits
-            "examples": [],  # Example conversations
-            "facts": []  # General facts about the user or topics
-        }
+                if verify:
+                    raise  # A half-saved edit must not replace the loaded knowledge with nothing
+        self._journal_seq = self._disk_seq = self._snapshot_seq
+        return knowledge
+    
+    def _snapshot_has_news(self) -> bool:
+        """Whether the snapshot on disk holds changes not applied here: a later compaction or a hand edit"""
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            meta = data.pop(META_KEY, {})
+        except (OSError, ValueError, AttributeError):
+            return False  # Missing or half-saved; keep serving what is loaded
+        if meta.get("journal_seq", 0) > self._journal_seq:
+            return True
+        knowledge = _empty_knowledge()
+        knowledge.update(data)
+        return meta.get("digest") != _digest(knowledge)
+    
+    def _replay_journal(self, loading: bool = False):
+        """Apply journaled changes made since the snapshot was written, resuming where the last replay stopped
+        
+        Once the journal continues from a snapshot this process has not
+        loaded, its entries are only counted until swap() brings that
+        snapshot in, so the version never claims changes that are missing.
+        """
+        self._journal_stamp = file_stamp(self.journal_path)
+        if self._journal_stamp is None:
+            return
+        with open(self.journal_path, 'rb') as f:
+            head = _journal_head(f)
+            if head != self._journal_head or self._journal_stamp[2] < self._journal_offset:
+                # Compacted since the last replay; the new journal is read from the start
+                self._journal_head = head
+                self._journal_offset = 0
+                self._journal_entries = 0
+            valid_offset = self._journal_offset
+            f.seek(valid_offset)
+            for raw_line in f:
+                try:
+                    if not raw_line.endswith(b"\n"):
+                        raise ValueError("Incomplete line")
+                    entry = json.loads(raw_line)
+                except ValueError:
+                    # A torn write from a crash; everything after it is discarded
+                    break
+                valid_offset += len(raw_line)
+                self._journal_entries += 1
+                if entry["seq"] <= self._disk_seq:
+                    continue  # Already folded into the snapshot
+                if entry["op"] == SNAPSHOT_OP:
+                    if loading:
+                        # The journal continues from a later snapshot than this one, which was restored by hand
+                        self.snapshot_edited = True
+                        self._journal_seq = entry["seq"]
+                elif self._journal_seq == self._disk_seq:
+                    self._apply(entry)
+                    self._journal_seq = entry["seq"]
+                self._disk_seq = entry["seq"]
+        # Only a writer may cut a torn tail; for anyone else it can be a write still in progress
+        if self._lock.held_exclusive and valid_offset < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid_offset)
+        self._journal_offset = valid_offset
+    
+    def refresh(self, reload_snapshot: bool = True, wait: bool = True) -> bool:
+        """Pick up changes other processes made since this one last looked, returning whether the version changed
+        
+        With reload_snapshot=False only new journal entries are applied; a
+        replaced snapshot is left for load_copy() and swap(). With wait=False
+        nothing happens while another process is writing.
+        """
+        if not self._write_lock.acquire(blocking=wait):
+            return False
+        try:
+            with (self._lock.shared() if wait else self._lock.try_shared()) as acquired:
+                return self._catch_up(reload_snapshot) if acquired else False
+        finally:
+            self._write_lock.release()
+    
+    def snapshot_changed(self) -> bool:
+        """Whether the snapshot file was replaced or edited since this process last read or wrote it"""
+        return file_stamp(self.file_path) != self._snapshot_stamp
+    
+    def load_copy(self) -> "KnowledgeBase":
+        """Load the knowledge base from disk into a separate instance, safe to call from a worker thread
+        
+        A hand-edited or restored snapshot is published by the copy, so its
+        compaction happens on the calling thread too.
+        """
+        copy = KnowledgeBase(
+            self.file_path,
+            compact_threshold=self.compact_threshold,
+            fsync=self.fsync,
+            passages_path=self.passages.path,
+            vector_search=False,
+            verify_snapshot=True
+        )
+        copy.publish_snapshot_edit(after_seq=self._disk_seq)
+        return copy
+    
+    def swap(self, copy: "KnowledgeBase") -> bool:
+        """Switch to the data and indexes of a copy from load_copy() in one step, returning whether the version changed
+        
+        Safe to call from a worker thread: it waits for this process's
+        writers, and readers see either the old data or the new. Changes
+        journaled while the copy loaded are applied afterwards.
+        """
+        with self._write_lock:
+            version = self.version
+            with self._state_lock:
+                for name in STATE_ATTRIBUTES:
+                    setattr(self, name, getattr(copy, name))
+            copy._lock.close()
+            self.refresh(reload_snapshot=False)
+            return self.version != version
+    
+    def publish_snapshot_edit(self, after_seq: int = 0):
+        """Compact a hand-edited snapshot under a new sequence number, so other processes and caches see a new version
+        
+        A snapshot older than after_seq (e.g. restored from a backup) counts
+        as edited too, and the new number always comes after it.
+        """
+        with self._writing():
+            self._publish_snapshot_edit(after_seq)
+    
+    def _publish_snapshot_edit(self, after_seq: int = 0):
+        """Publish a loaded hand edit; needs the exclusive lock"""
+        if (self.snapshot_edited or self._journal_seq < after_seq) and not self._has_unloaded_changes():
+            print("Knowledge base snapshot was edited by hand; publishing it as a new version")
+            self._journal_seq = self._disk_seq = max(self._journal_seq, after_seq) + 1
+            self._compact()
+    
+    def _has_unloaded_changes(self) -> bool:
+        """Whether the snapshot was replaced since it was loaded, or the journal continues from one not loaded here"""
+        return self.snapshot_changed() or self._disk_seq != self._journal_seq
+    
+    def _catch_up(self, reload_snapshot: bool = True) -> bool:
+        """Reload after another process compacted, otherwise apply new journal entries; needs the lock held
+        
+        With reload_snapshot=False a replaced snapshot is never read here;
+        the journal is still followed, so new changes are numbered after it.
+        """
+        version = self.version
+        with self._state_lock:
+            if reload_snapshot and self.snapshot_changed() and self._snapshot_has_news():
+                print("Knowledge base snapshot changed on disk; reloading")
+                self._load(verify=True)
+            else:
+                if reload_snapshot:
+                    # Unchanged, or compacted by another process from changes this one has already applied
+                    self._snapshot_stamp = file_stamp(self.file_path)
+                journal_stamp = file_stamp(self.journal_path)
+                # A tail past the offset is a torn write left unread at load; replaying under the lock cuts it
+                if journal_stamp != self._journal_stamp or (journal_stamp and journal_stamp[2] > self._journal_offset):
+                    self._replay_journal()
+            self.passages.refresh()
+        return self.version != version
+    
+    def _apply(self, entry: Dict):
+        """Apply a single change to the in-memory knowledge and indexes"""
+        op = entry["op"]
+        if op == "qa":
+            self.knowledge["qa_pairs"][entry["question"]] = entry["answer"]
+            self._indexes["qa"].add(entry["question"], entry["question"])
+        elif op == "personality":
+            self.knowledge["personality"][entry["trait"]] = entry["value"]
+        elif op == "fact":
+            if self._fact_index.find_duplicate(entry["fact"]) is None:
+                self.knowledge["facts"].append(entry["fact"])
+                self._indexes["fact"].add(entry["fact"], entry["fact"])
+                self._fact_index.add(entry["fact"])
+        elif op == "remove_fact":
+            if entry["fact"] in self._indexes["fact"]:
+                self.knowledge["facts"].remove(entry["fact"])
+                self._indexes["fact"].remove(entry["fact"], entry["fact"])
+                self._fact_index.remove(entry["fact"])
+        elif op == "example":
+            if (entry["user"], entry["assistant"]) in self._example_keys:
+                return  # Another process added the same example first
+            self.knowledge["examples"].append({
+                "user": entry["user"],
+                "assistant": entry["assistant"]
+            })
+            self._example_keys.add((entry["user"], entry["assistant"]))
+            self._indexes["example"].add(len(self.knowledge["examples"]) - 1, f"{entry['user']} {entry['assistant']}")
+        elif op == "remove_example":
+            key = (entry["user"], entry["assistant"])
+            if key in self._example_keys:
+                self.knowledge["examples"] = [
+                    example for example in self.knowledge["examples"]
+                    if (example["user"], example["assistant"]) != key
+                ]
+                self._index_examples()  # Examples are indexed by position, which shifted
+        elif op == "clear":
+            self.knowledge = _empty_knowledge()
+            self._build_indexes(rebuild_fact_index=True)
+        else:
+            raise ValueError(f"Unknown knowledge base operation: {op}")
+    
+    def _commit(self, entry: Dict):
+        """Apply a change and record it in the journal"""
+        with self._writing():
+            seq = self._disk_seq + 1
+            if self._journal_seq == self._disk_seq:
+                with self._state_lock:
+                    self._apply(entry)
+                    self._journal_seq = seq
+            self._disk_seq = seq
+            line = json.dumps({"seq": seq, **entry}, ensure_ascii=False)
+            if self._pending is not None:
+                self._pending.append(line)
+            else:
+                self._append_journal([line])
+    
+    @contextmanager
+    def _writing(self):
+        """Hold the exclusive lock, caught up with other processes, so new sequence numbers follow theirs
+        
+        Under hot reload only the journal is replayed; a replaced snapshot is
+        left for load_copy() and swap() off the request path.
+        """
+        with self._write_lock:
+            if self._lock.held_exclusive:
+                yield
+                return
+            with self._lock.exclusive():
+                self._catch_up(reload_snapshot=not self.hot_reload)
+                self._publish_snapshot_edit()
+                yield
+    
+    def _append_journal(self, lines: List[str]):
+        """Durably append entries to the journal, compacting in the background when it grows too long"""
+        if self._journal_offset == 0:
+            self._journal_head = json.loads(lines[0])["seq"]
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+        self._journal_entries += len(lines)
+        if self._journal_entries >= self.compact_threshold and (self._compaction is None or self._compaction.done()):
+            self._compaction = _background.submit(self._compact_if_needed)
+    
+    @contextmanager
+    def batch(self):
+        """Group many changes into a single journal write
+        
+        Other processes' writes wait until the batch ends, so passage changes
+        made inside it (followed by passages.save()) cannot overwrite theirs.
+        """
+        with self._writing():
+            if self._pending is not None:
+                yield  # Already inside a batch
+                return
+            self._pending = []
+            try:
+                yield
+            finally:
+                lines, self._pending = self._pending, None
+                if lines:
+                    self._append_journal(lines)
+    
+    def compact(self):
+        """Fold the journal into a new snapshot written atomically"""
+        with self._writing():
+            self._compact()
+    
+    def _compact_if_needed(self):
+        """Compact unless another process already did; runs on the background thread"""
+        try:
+            with self._writing():
+                if self._journal_entries >= self.compact_threshold:
+                    self._compact()
+        except Exception as e:
+            print(f"Knowledge base compaction failed: {e}")
+    
+    def _compact(self):
+        """Write the snapshot and start a new journal; needs the exclusive lock"""
+        if self._has_unloaded_changes():
+            return  # Writing this process's view would drop them; the next compaction after swap() catches up
+        snapshot = dict(self.knowledge)
+        snapshot[META_KEY] = {"journal_seq": self._journal_seq, "digest": _digest(self.knowledge)}
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, self.file_path)
+        self._snapshot_stamp = file_stamp(self.file_path)
+        self._snapshot_seq = self._journal_seq
+        self.snapshot_edited = False
+        self._save_fact_index()
+        
+        # Entries up to the snapshot sequence are skipped on replay, so a crash
+        # before this replacement cannot apply them twice
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"seq": self._journal_seq, "op": SNAPSHOT_OP}) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+        os.replace(temp_path, self.journal_path)
+        self._journal_head = self._journal_seq
+        self._journal_entries = 0
     
     def _save_knowledge(self):
         """Save knowledge base to file"""
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.knowledge, f, indent=2, ensure_ascii=False)
+        self.compact()
+    
+    def _save_fact_index(self):
+        """Persist fact hashes next to the snapshot so loading can skip rehashing"""
+        data = {
+            "journal_seq": self._snapshot_seq,
+            "entries": self._fact_index.to_entries(self.knowledge["facts"])
+        }
+        temp_path = self.fact_index_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.fact_index_path)
+    
+    def _load_fact_index(self) -> bool:
+        """Load the persisted fact index if it matches the snapshot"""
+        try:
+            # A snapshot edited by hand after the index was written needs rehashing
+            if os.path.getmtime(self.fact_index_path) < os.path.getmtime(self.file_path):
+                return False
+            with open(self.fact_index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data["journal_seq"] != self._snapshot_seq:
+                return False
+            self._fact_index.load_entries(self.knowledge["facts"], data["entries"])
+            return True
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+    
+    def _build_indexes(self, rebuild_fact_index: bool = True):
+        """Build the search indexes from the loaded knowledge"""
+        for index in self._indexes.values():
+            index.clear()
+        for question in self.knowledge["qa_pairs"]:
+            self._indexes["qa"].add(question, question)
+        if rebuild_fact_index:
+            self._fact_index.clear()
+        for fact in self.knowledge["facts"]:
+            self._indexes["fact"].add(fact, fact)
+            if rebuild_fact_index:
+                self._fact_index.add(fact)
+        self._index_examples()
+    
+    def _index_examples(self):
+        """Rebuild the example index and duplicate keys from the loaded examples"""
+        self._indexes["example"].clear()
+        self._example_keys = set()
+        for position, example in enumerate(self.knowledge["examples"]):
+            self._indexes["example"].add(position, f"{example['user']} {example['assistant']}")
+            self._example_keys.add((example["user"], example["assistant"]))
+    
+    def clear(self):
+        """Remove all training data"""
+        with self._writing():
+            self._commit({"op": "clear"})
+            with self._state_lock:
+                self.passages.clear()
+            self.passages.save()
     
     def add_qa_pair(self, question: str, answer: str):
         """Add a question-answer pair"""
-        self.knowledge["qa_pairs"][question.lower()] = answer
-        self._save_knowledge()
+        self._commit({"op": "qa", "question": question.lower(), "answer": answer})
     
     def get_answer(self, question: str) -> Optional[str]:
         """Get answer for a question"""
@@ -44,35 +561,114 @@ class KnowledgeBase:
     
     def add_personality_trait(self, trait: str, value: str):
         """Add personality trait"""
-        self.knowledge["personality"][trait] = value
-        self._save_knowledge()
+        self._commit({"op": "personality", "trait": trait, "value": value})
     
+    @_reading
     def get_personality_traits(self) -> Dict:
-        """Get all personality traits"""
-        return self.knowledge["personality"]
+        """Get a copy of all personality traits"""
+        return dict(self.knowledge["personality"])
+    
+    def add_fact(self, fact: str) -> bool:
+        """Add a fact to the knowledge base, returning False if the same fact is already stored"""
+        with self._writing():
+            if self._fact_index.find_duplicate(fact) is not None:
+                return False
+            self._commit({"op": "fact", "fact": fact})
+            return True
     
-    def add_fact(self, fact: str):
-        """Add a fact to the knowledge base"""
-        if fact not in self.knowledge["facts"]:
-            self.knowledge["facts"].append(fact)
-            self._save_knowledge()
+    def remove_fact(self, fact: str) -> bool:
+        """Remove a fact from the knowledge base, returning False if it was not stored"""
+        with self._writing():
+            if fact not in self._indexes["fact"]:
+                return False
+            self._commit({"op": "remove_fact", "fact": fact})
+            return True
+    
+    @_reading
+    def find_similar_fact(self, fact: str) -> Optional[str]:
+        """Get a stored fact that nearly duplicates the given one, such as an older version of a correction"""
+        return self._fact_index.find_similar(fact)
     
     def get_facts(self) -> List:
         """Get all facts"""
         return self.knowledge["facts"]
     
     def add_example_conversation(self, user_message: str, assistant_response: str):
-        """Add example conversation"""
-        self.knowledge["examples"].append({
-            "user": user_message,
-            "assistant": assistant_response
-        })
-        self._save_knowledge()
+        """Add example conversation, skipping exact repeats"""
+        with self._writing():
+            if (user_message, assistant_response) not in self._example_keys:
+                self._commit({"op": "example", "user": user_message, "assistant": assistant_response})
+    
+    def remove_example_conversation(self, user_message: str, assistant_response: str) -> bool:
+        """Remove an example conversation, returning False if it was not stored"""
+        with self._writing():
+            if (user_message, assistant_response) not in self._example_keys:
+                return False
+            self._commit({"op": "remove_example", "user": user_message, "assistant": assistant_response})
+            return True
+    
+    @_reading
+    def export_knowledge(self) -> Dict:
+        """Get a deep copy of all training data, safe to serialize while writers run"""
+        return deepcopy(self.knowledge)
     
     def get_example_conversations(self) -> List:
         """Get all example conversations"""
         return self.knowledge["examples"]
     
+    def add_entries(self, entries: Iterable[Dict]) -> Dict:
+        """Add many mixed entries at once, skipping duplicates, with a single journal write
+        
+        Each entry has a "type" of qa, fact, example or personality plus that
+        type's fields from ENTRY_FIELDS. Facts similar to a stored one are
+        still added and reported as warnings.
+        """
+        added = {entry_type: 0 for entry_type in ENTRY_FIELDS}
+        duplicates = 0
+        errors = []
+        warnings = []
+        
+        with self.batch():
+            for position, entry in enumerate(entries):
+                entry_type = entry.get("type") if isinstance(entry, dict) else None
+                fields = ENTRY_FIELDS.get(entry_type)
+                if not fields:
+                    errors.append({"index": position, "error": f"Unknown entry type: {entry_type}"})
+                    continue
+                values = [entry.get(field) for field in fields]
+                if not all(isinstance(value, str) and value.strip() for value in values):
+                    errors.append({"index": position, "error": f"{entry_type} entries require {', '.join(fields)}"})
+                    continue
+                
+                if self._is_duplicate(entry_type, *values):
+                    duplicates += 1
+                    continue
+                if entry_type == "qa":
+                    self._commit({"op": "qa", "question": values[0].lower(), "answer": values[1]})
+                elif entry_type == "fact":
+                    similar = self._fact_index.find_similar(values[0])
+                    if similar is not None:
+                        warnings.append({"index": position, "warning": f"Similar to stored fact: {similar}"})
+                    self._commit({"op": "fact", "fact": values[0]})
+                elif entry_type == "example":
+                    self._commit({"op": "example", "user": values[0], "assistant": values[1]})
+                else:
+                    self._commit({"op": "personality", "trait": values[0], "value": values[1]})
+                added[entry_type] += 1
+        
+        return {"added": added, "duplicates": duplicates, "errors": errors, "warnings": warnings}
+    
+    def _is_duplicate(self, entry_type: str, *values: str) -> bool:
+        """Check whether an entry is already stored with the same content"""
+        if entry_type == "qa":
+            return self.knowledge["qa_pairs"].get(values[0].lower()) == values[1]
+        if entry_type == "fact":
+            return self._fact_index.find_duplicate(values[0]) is not None
+        if entry_type == "example":
+            return (values[0], values[1]) in self._example_keys
+        return self.knowledge["personality"].get(values[0]) == values[1]
+    
+    @_reading
     def get_context(self) -> str:
         """Get knowledge context for the AI"""
         context = ""
@@ -91,17 +687,139 @@ class KnowledgeBase:
         
         return context
     
+    @_reading
+    def search(self, query: str, k: int = 5, kinds: Sequence[str] = SEARCH_KINDS) -> List[Dict]:
+        """Rank QA pairs, facts and examples against a query using BM25"""
+        results = []
+        for kind in kinds:
+            for key, score in self._indexes[kind].search(query, k):
+                if kind == "qa":
+                    result = {"question": key, "answer": self.knowledge["qa_pairs"][key]}
+                elif kind == "fact":
+                    result = {"fact": key}
+                else:
+                    result = dict(self.knowledge["examples"][key])
+                result.update({"type": kind, "score": score})
+                results.append(result)
+        results.sort(key=lambda result: result["score"], reverse=True)
+        return results[:k]
+    
+    @_reading
+    def vector_items(self) -> Dict:
+        """Texts to embed in the vector index, keyed by (kind, id)"""
+        items = {("fact", fact): fact for fact in self.knowledge["facts"]}
+        items.update({("qa", question): question for question in self.knowledge["qa_pairs"]})
+        items.update({
+            ("passage", passage_id): PassageStore.index_text(passage)
+            for passage_id, passage in self.passages.items()
+        })
+        return items
+    
+    def sync_vectors(self, wait: bool = True):
+        """Embed the items the vector index is missing and save it, on a background thread unless waiting
+        
+        Only items added since the last save are embedded.
+        """
+        if self.vectors is None or self.vectors.version == self.version:
+            return
+        items, version = self.vector_items(), self.version
+        if wait:
+            self.vectors.update(items, version=version)
+        elif self._vector_sync is None or self._vector_sync.done():
+            self._vector_sync = _background.submit(self.vectors.update, items, version)
+            self._vector_sync.add_done_callback(_report_vector_sync)
+    
+    @_reading
+    def semantic_search(self, query: str, k: int = 5, kinds: Sequence[str] = VECTOR_KINDS, min_score: float = 0.1) -> List[Dict]:
+        """Rank QA pairs, facts and passages against a query by embedding similarity
+        
+        Returns nothing until the vector index has caught up with this
+        version, so retrieval falls back to BM25 alone instead of waiting.
+        """
+        if self.vectors is None:
+            return []
+        if self.vectors.version != self.version:
+            self.sync_vectors(wait=False)
+            return []
+        results = []
+        for (kind, key), score in self.vectors.search(query, k, kinds):
+            if score < min_score:
+                continue
+            if kind == "qa":
+                result = {"question": key, "answer": self.knowledge["qa_pairs"][key]}
+            elif kind == "fact":
+                result = {"fact": key}
+            else:
+                passage = self.passages.get(key)
+                if passage is None:
+                    continue
+                result = {**passage, "id": key}
+            result.update({"type": kind, "score": score})
+            results.append(result)
+        return results
+    
+    @_reading
+    def retrieve_context(self, query: str, top_k: int = 5, token_budget: int = 1500, example_count: int = 3) -> Dict:
+        """Select the facts, passages and examples most relevant to a query within a token budget"""
+        remaining = token_budget
+        
+        # Facts and website passages compete for the same budget. Lexical and vector
+        # rankings are fused by rank, since BM25 and cosine scores are not comparable
+        lexical = self.search(query, k=top_k, kinds=("fact",))
+        lexical += [{**passage, "type": "passage"} for passage in self.passages.search(query, k=top_k)]
+        lexical.sort(key=lambda result: result["score"], reverse=True)
+        semantic = self.semantic_search(query, k=top_k, kinds=("fact", "passage"))
+        fused = {}
+        for ranking in (lexical[:top_k], semantic):
+            for rank, result in enumerate(ranking):
+                key = (result["type"], result["fact"] if result["type"] == "fact" else result["id"])
+                score, _ = fused.get(key, (0.0, result))
+                fused[key] = (score + 1.0 / (RRF_K + rank + 1), result)
+        
+        facts = []
+        passages = []
+        for _, result in sorted(fused.values(), key=lambda item: item[0], reverse=True)[:top_k]:
+            if result["type"] == "fact":
+                cost = estimate_tokens(result["fact"])
+                if cost > remaining:
+                    continue
+                facts.append(result["fact"])
+            else:
+                cost = estimate_tokens(result["text"])
+                if cost > remaining:
+                    continue
+                passages.append({key: result[key] for key in ("url", "title", "heading", "text")})
+            remaining -= cost
+        
+        # Examples mostly guide tone, so fall back to the latest ones when none match
+        candidates = [
+            {"user": result["user"], "assistant": result["assistant"]}
+            for result in self.search(query, k=example_count, kinds=("example",))
+        ]
+        if not candidates:
+            candidates = self.knowledge["examples"][-example_count:]
+        examples = []
+        for example in candidates:
+            cost = estimate_tokens(example["user"]) + estimate_tokens(example["assistant"])
+            if cost > remaining:
+                continue
+            examples.append(example)
+            remaining -= cost
+        
+        return {"facts": facts, "passages": passages, "examples": examples}
+    
+    @_reading
     def search_qa(self, query: str) -> Optional[str]:
-        """Search for similar questions and return answers"""
+        """Search for similar questions and return the best-ranked answer"""
         query_lower = query.lower()
         
         # Exact match
         if query_lower in self.knowledge["qa_pairs"]:
             return self.knowledge["qa_pairs"][query_lower]
         
-        # Partial match
-        for question, answer in self.knowledge["qa_pairs"].items():
-            if any(word in question for word in query_lower.split()):
-                return answer
+        # Ranked match on meaningful words, ignoring stop words
+        results = self.search(query, k=1, kinds=("qa",))
+        if results:
+            return results[0]["answer"]
         
         return None
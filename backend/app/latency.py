@@ -0,0 +1,65 @@
+"""
+Fixed-memory latency histograms
+"""
+
+import math
+import threading
+from typing import Dict
+
+
+class LatencyHistogram:
+    """Histogram of durations in log-spaced buckets, with percentile estimates
+
+    Buckets grow by a constant factor, so any percentile is known to within
+    that factor (about 10% by default) at a fixed memory cost.
+    """
+
+    def __init__(self, min_seconds: float = 0.01, max_seconds: float = 300.0, growth: float = 1.1):
+        self.min_seconds = min_seconds
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self._counts = [0] * (self._bucket(max_seconds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """Add one observed duration"""
+        bucket = min(self._bucket(seconds), len(self._counts) - 1)
+        with self._lock:
+            self._counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, percentile: float) -> float:
+        """Estimate the duration below which the given percentage (0-100) of observations fall"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = math.ceil(self.count * percentile / 100.0)
+            seen = 0
+            for bucket, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank:
+                    return self._upper_bound(bucket)
+            return self._upper_bound(len(self._counts) - 1)
+
+    def snapshot(self) -> Dict:
+        """Summarize the histogram for diagnostics"""
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3)
+        }
+
+    def _bucket(self, seconds: float) -> int:
+        """Index of the bucket holding a duration"""
+        if seconds <= self.min_seconds:
+            return 0
+        return int(math.log(seconds / self.min_seconds) / self._log_growth) + 1
+
+    def _upper_bound(self, bucket: int) -> float:
+        """Largest duration that falls in a bucket"""
+        return self.min_seconds * self.growth ** bucket
@@ -1,85 +1,206 @@
 import httpx
 import json
-from typing import List, Optional
+import threading
+from array import array
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Set, Tuple
 from .models import ChatMessage
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from business_config import SYSTEM_PROMPT_TEMPLATE
 from .knowledge_base import KnowledgeBase
+from .prompt_builder import PromptBuilder
+from .http_client import create_http_client
+from .errors import (
+    ProviderError, ProviderResponseError, ProviderTimeoutError, ProviderUnavailableError, QuotaExceededError
+)
+
+class OllamaSessionContexts:
+    """LRU of the token context Ollama returned at the end of each session's last turn
+
+    Sending a context back lets Ollama continue from its evaluated tokens, so
+    a follow-up turn only pays prefill for the new prompt. A context is only
+    reused when it was produced under the current prompt prefix and ended
+    with the assistant message now in the session history; otherwise the
+    caller falls back to a full prompt. Each context also records which
+    retrieved items it already holds, so they are not sent again.
+    """
+    
+    def __init__(self, max_sessions: int = 500, max_tokens: int = 4096):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens  # Longer contexts are dropped rather than overflowing the model window
+        self._contexts: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id: Optional[str], prefix: str,
+            conversation_history: List[ChatMessage]) -> Optional[Tuple[List[int], Set[tuple]]]:
+        """Get a session's context and the retrieved items in it if it still matches the prefix and the last assistant turn"""
+        if not session_id or not conversation_history or len(conversation_history) < 2:
+            return None
+        with self._lock:
+            entry = self._contexts.get(session_id)
+            if entry is None:
+                return None
+            context_prefix, tokens, last_response, sent = entry
+            previous = conversation_history[-2]
+            if context_prefix != prefix or previous.role != "assistant" or previous.content != last_response:
+                del self._contexts[session_id]
+                return None
+            self._contexts.move_to_end(session_id)
+            return tokens.tolist(), set(sent)
+    
+    def put(self, session_id: Optional[str], prefix: str, tokens: Optional[List[int]], response_text: str,
+            sent: Set[tuple] = frozenset()):
+        """Remember the context a turn ended with and the retrieved items sent into it, evicting the least recently used session"""
+        if not session_id or not self.max_sessions:
+            return
+        with self._lock:
+            if not tokens or len(tokens) > self.max_tokens:
+                self._contexts.pop(session_id, None)
+                return
+            self._contexts[session_id] = (prefix, array("I", tokens), response_text, frozenset(sent))
+            self._contexts.move_to_end(session_id)
+            while len(self._contexts) > self.max_sessions:
+                self._contexts.popitem(last=False)
+    
+    def forget(self, session_id: str):
+        """Drop a session's context"""
+        with self._lock:
+            self._contexts.pop(session_id, None)
+    
+    def __len__(self) -> int:
+        return len(self._contexts)
 
 class OllamaClient:
     """Client for interacting with Ollama local LLM"""
     
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3.1", knowledge_base: KnowledgeBase = None):
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3.1", knowledge_base: KnowledgeBase = None,
+                 retrieval_top_k: int = 5, context_token_budget: int = 1500, prompt_builder: PromptBuilder = None,
+                 keep_alive: Optional[str] = "30m", context_sessions: int = 500, max_context_tokens: int = 4096,
+                 http_client: httpx.AsyncClient = None):
         self.base_url = base_url
         self.model = model
-        self.client = httpx.AsyncClient(timeout=300.0)  # Increased timeout to 5 minutes
+        # The app injects a pooled client at startup; a default one is only created on first use without it
+        self._client = http_client
         self.knowledge_base = knowledge_base or KnowledgeBase()
+        self.prompt_builder = prompt_builder or PromptBuilder(
+            self.knowledge_base,
+            retrieval_top_k=retrieval_top_k,
+            context_token_budget=context_token_budget
+        )
+        # Keeping the model loaded lets Ollama reuse the evaluated system prompt across requests
+        self.keep_alive = keep_alive
+        self.session_contexts = OllamaSessionContexts(max_sessions=context_sessions, max_tokens=max_context_tokens)
     
-    async def generate_response(self, message: str, conversation_history: List[ChatMessage] = None) -> str:
-        """Generate a response using the local LLM"""
+    async def generate_response(self, message: str, conversation_history: List[ChatMessage] = None, session_id: Optional[str] = None) -> str:
+        """Generate a response using the local LLM, raising ProviderError on failure"""
+        # Check if we have a trained answer for this question
+        trained_answer = self.knowledge_base.get_answer(message)
+        if trained_answer:
+            return trained_answer
+        
         try:
-            # Check if we have a trained answer for this question
-            trained_answer = self.knowledge_base.get_answer(message)
-            if trained_answer:
-                return trained_answer
-            
-            # Prepare the conversation context
-            context = self._build_context(message, conversation_history)
-            
             # Make request to Ollama
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": context,
-                    "stream": False
-                }
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "I'm sorry, I couldn't generate a response.")
-            else:
-                return f"Error: LLM service returned status {response.status_code}"
-                
-        except httpx.TimeoutException:
-            return "I'm taking a bit longer to respond. Please try again in a moment - Ollama might be processing your request."
-        except httpx.ConnectError:
-            return "I can't connect to Ollama right now. Please make sure Ollama is running and try again."
-        except Exception as e:
-            return f"I encountered an issue: {str(e)}. Please try again."
-    
-    def _build_context(self, message: str, conversation_history: List[ChatMessage] = None) -> str:
-        """Build context from conversation history and knowledge base"""
-        context = SYSTEM_PROMPT_TEMPLATE + "\n\n"
-        
-        # Add personality traits
-        personality_traits = self.knowledge_base.get_personality_traits()
-        if personality_traits:
-            context += "PERSONALITY TRAITS:\n"
-            for trait, value in personality_traits.items():
-                context += f"- {trait}: {value}\n"
-            context += "\n"
+            prefix = self.prompt_builder.prefix()
+            payload, sent = self._payload(message, prefix, stream=False, conversation_history=conversation_history, session_id=session_id)
+            response = await self.client.post(f"{self.base_url}/api/generate", json=payload)
+            self._raise_for_status(response)
+            result = response.json()
+        except httpx.HTTPError as e:
+            raise self._provider_error(e) from e
+        except ValueError as e:
+            raise ProviderResponseError("ollama", f"invalid JSON response: {e}") from e
         
-        # Add relevant facts
-        facts = self.knowledge_base.get_facts()
-        if facts:
-            context += "IMPORTANT FACTS:\n"
-            for fact in facts:
-                context += f"- {fact}\n"
-            context += "\n"
+        if result.get("error"):
+            raise ProviderResponseError("ollama", result["error"])
+        response_text = result.get("response") or "I'm sorry, I couldn't generate a response."
+        self.session_contexts.put(session_id, prefix, result.get("context"), response_text, sent)
+        return response_text
+    
+    async def stream_response(self, message: str, conversation_history: List[ChatMessage] = None, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream a response from the local LLM as tokens arrive, raising ProviderError on failure"""
+        # Trained answers are returned in a single chunk
+        trained_answer = self.knowledge_base.get_answer(message)
+        if trained_answer:
+            yield trained_answer
+            return
         
-        # Add example conversations for context
-        examples = self.knowledge_base.get_example_conversations()
-        if examples:
-            context += "EXAMPLE CONVERSATIONS:\n"
-            for example in examples[-3:]:  # Use last 3 examples
-                context += f"User: {example['user']}\nAssistant: {example['assistant']}\n\n"
+        try:
+            # Ollama streams one JSON object per line until "done" is true
+            prefix = self.prompt_builder.prefix()
+            payload, sent = self._payload(message, prefix, stream=True, conversation_history=conversation_history, session_id=session_id)
+            tokens = []
+            async with self.client.stream("POST", f"{self.base_url}/api/generate", json=payload) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    self._raise_for_status(response)
+                
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise ProviderResponseError("ollama", chunk["error"])
+                    token = chunk.get("response")
+                    if token:
+                        tokens.append(token)
+                        yield token
+                    if chunk.get("done"):
+                        # The final chunk carries the context for the session's next turn
+                        self.session_contexts.put(session_id, prefix, chunk.get("context"), "".join(tokens), sent)
+                        return
+        except httpx.HTTPError as e:
+            raise self._provider_error(e) from e
+        except ValueError as e:
+            raise ProviderResponseError("ollama", f"invalid stream chunk: {e}") from e
+    
+    def _raise_for_status(self, response: httpx.Response):
+        """Turn an unsuccessful Ollama response into a typed error"""
+        if response.status_code == 200:
+            return
+        try:
+            detail = response.json().get("error") or response.text
+        except ValueError:
+            detail = response.text
+        detail = f"status {response.status_code}: {detail}"
+        if response.status_code == 429:
+            retry_after = response.headers.get("retry-after")
+            raise QuotaExceededError("ollama", detail, float(retry_after) if retry_after and retry_after.isdigit() else None)
+        if response.status_code >= 500:
+            raise ProviderUnavailableError("ollama", detail)
+        raise ProviderResponseError("ollama", detail)
+    
+    @staticmethod
+    def _provider_error(error: httpx.HTTPError) -> ProviderError:
+        """Map an httpx transport error to a typed provider error"""
+        if isinstance(error, httpx.TimeoutException):
+            return ProviderTimeoutError("ollama", "request timed out")
+        if isinstance(error, (httpx.ConnectError, httpx.RemoteProtocolError)):
+            return ProviderUnavailableError("ollama", f"cannot connect: {error}")
+        return ProviderUnavailableError("ollama", str(error) or type(error).__name__)
+    
+    def _payload(self, message: str, prefix: str, stream: bool, conversation_history: List[ChatMessage] = None,
+                 session_id: Optional[str] = None) -> Tuple[dict, Set[tuple]]:
+        """Build a generate request that continues the session's context when possible
         
-        context += f"Please respond to: {message}"
-        return context
+        A continued context already holds the earlier turns, so only the new
+        message and the retrieved items the context does not contain yet are
+        sent. Without a reusable context the prefix is sent as the system
+        prompt and recent history is written into the prompt, so evicted
+        sessions keep their conversation at the cost of a full prefill.
+        Returns the payload and the retrieved items the resulting context holds.
+        """
+        payload = {"model": self.model, "stream": stream}
+        reused = self.session_contexts.get(session_id, prefix, conversation_history)
+        if reused is not None:
+            payload["context"], sent = reused
+            payload["prompt"] = self.prompt_builder.suffix(message, history_messages=0, sent=sent)
+        else:
+            # The last history entry is the message being answered
+            earlier_turns = conversation_history[:-1] if conversation_history else None
+            sent = set()
+            payload["system"] = prefix
+            payload["prompt"] = self.prompt_builder.suffix(message, earlier_turns, sent=sent)
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        return payload, sent
     
     async def check_health(self) -> bool:
         """Check if Ollama service is running"""
@@ -90,6 +211,23 @@ class OllamaClient:
             return False
     
     
+    def forget_session(self, session_id: str):
+        """Drop the retained context of a cleared conversation"""
+        self.session_contexts.forget(session_id)
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client used for Ollama requests"""
+        if self._client is None:
+            self._client = create_http_client()
+        return self._client
+    
+    @client.setter
+    def client(self, http_client: httpx.AsyncClient):
+        self._client = http_client
+    
     async def close(self):
         """Close the HTTP client"""
-        await self.client.aclose()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,29 +1,102 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from datetime import datetime
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+import json
 import os
 
 from .models import ChatRequest, ChatResponse, HealthResponse
 from .chatbot import ChatbotService
 from .knowledge_base import KnowledgeBase
+from .bulk_import import iter_entries
+from .http_client import create_http_client
+from .admission import AdmissionController, AdmissionRejected
+from .hot_reload import HotReloader
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    OLLAMA_CONNECT_TIMEOUT_SECONDS, OLLAMA_READ_TIMEOUT_SECONDS, OLLAMA_POOL_TIMEOUT_SECONDS, OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS, OLLAMA_KEEPALIVE_EXPIRY_SECONDS, OLLAMA_HTTP2,
+    OLLAMA_MAX_CONCURRENT_REQUESTS, GEMINI_MAX_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    HOT_RELOAD_INTERVAL_SECONDS
+)
+
+# Provider calls queue per provider instead of piling onto a saturated backend
+admission = AdmissionController(
+    {"ollama": OLLAMA_MAX_CONCURRENT_REQUESTS, "gemini": GEMINI_MAX_CONCURRENCY},
+    max_queue=ADMISSION_QUEUE_SIZE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS
+)
+
+# Initialize shared knowledge base and chatbot service
+# Replaced snapshots always go through load_copy() and swap(): in the background, or from the
+# refresh middleware when hot reload is off
+knowledge_base = KnowledgeBase(hot_reload=True)
+chatbot_service = ChatbotService(knowledge_base=knowledge_base, admission=admission)
+
+# Edits to knowledge_base.json and business_config.py are picked up without a restart
+reloader = HotReloader(knowledge_base, chatbot_service.set_system_prompt, interval_seconds=HOT_RELOAD_INTERVAL_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the provider connection pools and background tasks for the life of the app"""
+    if chatbot_service.ollama_client:
+        chatbot_service.ollama_client.client = create_http_client(
+            connect_timeout=OLLAMA_CONNECT_TIMEOUT_SECONDS,
+            read_timeout=OLLAMA_READ_TIMEOUT_SECONDS,
+            pool_timeout=OLLAMA_POOL_TIMEOUT_SECONDS,
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY_SECONDS,
+            http2=OLLAMA_HTTP2
+        )
+    chatbot_service.health_monitor.start()
+    reloader.start()
+    try:
+        yield
+    finally:
+        await reloader.stop()
+        # Stops the probes before closing the pools they use
+        await chatbot_service.close()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="LLM ChatBot API",
     description="AI Chatbot with local LLM support",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize shared knowledge base and chatbot service
-knowledge_base = KnowledgeBase()
-chatbot_service = ChatbotService(knowledge_base=knowledge_base)
-
 # Mount static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Endpoints that answer from the knowledge base, refreshed with other workers' changes first
+KNOWLEDGE_READ_PATHS = ("/api/chat", "/api/chat/stream", "/api/train/knowledge", "/api/kb/version")
+
+# Bulk imports are committed this many entries at a time; only the first BULK_MAX_ERRORS errors and warnings are returned
+BULK_BATCH_SIZE = 500
+BULK_MAX_ERRORS = 100
+
+@app.middleware("http")
+async def refresh_knowledge(request: Request, call_next):
+    """Pick up knowledge base changes written by other workers before answering from the knowledge base"""
+    if request.url.path in KNOWLEDGE_READ_PATHS:
+        # Never waits on the file lock: while another process writes, this request uses the current version
+        knowledge_base.refresh(reload_snapshot=False, wait=False)
+        if knowledge_base.snapshot_changed():
+            if reloader.running:
+                # A compacted or hand-edited snapshot is loaded in the background; until then the current version serves
+                reloader.wake()
+            else:
+                # Hot reload is off, but another worker's compaction still has to be picked up, off the event loop
+                await reloader.check_knowledge()
+    return await call_next(request)
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """Serve the main chat interface"""
@@ -38,36 +111,130 @@ async def train_interface(request: Request):
 async def chat(request: ChatRequest):
     """Main chat endpoint for processing messages"""
     try:
-        response = await chatbot_service.process_message(request)
-        return response
+        # Admission is taken inside the service, only when a provider is actually called
+        return await chatbot_service.process_message(request)
+    except AdmissionRejected as e:
+        raise _rejection(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Streaming chat endpoint that sends tokens as newline-delimited JSON events"""
+    events = chatbot_service.stream_message(request)
+    # Admission happens on the way to the first event, before the response starts, so rejections can still carry a status code
+    try:
+        first_event = await events.__anext__()
+    except AdmissionRejected as e:
+        raise _rejection(e)
+    except Exception as e:
+        first_event = {"type": "error", "detail": str(e)}
+    
+    async def event_stream():
+        try:
+            yield json.dumps(first_event) + "\n"
+            if first_event["type"] != "error":
+                async for event in events:
+                    yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+    
+    return _ClosingStreamingResponse(
+        event_stream(),
+        close=events.aclose,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """Streaming response that closes the chat event stream however it ends
+    
+    A client that disconnects before the body starts means the body generator
+    never runs, so the event stream (and the admission slot it may hold) has
+    to be closed here.
+    """
+    
+    def __init__(self, content, close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.close = close
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.close()
+
+def _rejection(error: AdmissionRejected) -> HTTPException:
+    """Turn an admission rejection into a retryable HTTP error"""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=error.detail,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     llm_status = "healthy" if await chatbot_service.check_llm_health() else "unhealthy"
+    monitor = chatbot_service.health_monitor
     
     return HealthResponse(
         status="healthy",
         timestamp=datetime.now(),
-        llm_status=llm_status
+        llm_status=llm_status,
+        checked_at=monitor.checked_at,
+        providers=monitor.status()
     )
 
 @app.get("/api/conversation")
-async def get_conversation():
-    """Get current conversation history"""
-    return {"conversation": chatbot_service.get_conversation_history()}
+def get_conversation(session_id: str):
+    """Get conversation history for a session"""
+    return {
+        "session_id": session_id,
+        "conversation": chatbot_service.get_conversation_history(session_id)
+    }
 
 @app.post("/api/conversation/clear")
-async def clear_conversation():
-    """Clear conversation history"""
-    chatbot_service.clear_conversation()
+def clear_conversation(session_id: Optional[str] = None):
+    """Clear conversation history for a session"""
+    if session_id:
+        chatbot_service.clear_conversation(session_id)
     return {"message": "Conversation cleared successfully"}
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Get response cache hit/miss counters and request coalescing counters"""
+    return {
+        "response_cache": chatbot_service.response_cache.stats(),
+        "semantic_cache": chatbot_service.semantic_cache.stats(),
+        "coalescing": chatbot_service.single_flight.stats()
+    }
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    """Get per-provider concurrency, queue depth and wait time metrics"""
+    return admission.stats()
+
+@app.get("/api/kb/version")
+async def knowledge_base_version():
+    """Get the active knowledge base version and when it and the business config were last reloaded"""
+    return reloader.status()
+
+@app.post("/api/kb/reload")
+async def reload_knowledge_base():
+    """Reload the knowledge base and business config from disk now"""
+    await reloader.check_now(force=True)
+    return reloader.status()
+
+@app.get("/api/providers")
+async def provider_status():
+    """Get the circuit breaker state of each LLM provider"""
+    return chatbot_service.router.stats()
+
 # Training Endpoints
+# Plain def endpoints run on the threadpool, so knowledge base writes (file lock, fsync) never block the event loop
 @app.post("/api/train/qa")
-async def train_qa_pair(request: dict):
+def train_qa_pair(request: dict):
     """Add a question-answer pair to the knowledge base"""
     question = request.get("question")
     answer = request.get("answer")
@@ -77,7 +244,7 @@ async def train_qa_pair(request: dict):
     return {"message": f"Added QA pair: {question} -> {answer}"}
 
 @app.post("/api/train/personality")
-async def train_personality(request: dict):
+def train_personality(request: dict):
     """Add personality trait"""
     trait = request.get("trait")
     value = request.get("traitValue")
@@ -87,16 +254,35 @@ async def train_personality(request: dict):
     return {"message": f"Added personality trait: {trait} = {value}"}
 
 @app.post("/api/train/fact")
-async def train_fact(request: dict):
+def train_fact(request: dict):
     """Add a fact to the knowledge base"""
     fact = request.get("fact")
     if not fact:
         raise HTTPException(status_code=400, detail="Fact is required")
-    knowledge_base.add_fact(fact)
-    return {"message": f"Added fact: {fact}"}
+    similar = knowledge_base.find_similar_fact(fact)
+    if not knowledge_base.add_fact(fact):
+        return {"message": f"Fact already known: {fact}", "duplicate": True, "similar_to": None}
+    if similar is not None:
+        # Near matches are usually corrections, so they are kept and the old fact is pointed out for removal
+        return {
+            "message": f"Added fact: {fact} (similar to stored fact: {similar})",
+            "duplicate": False,
+            "similar_to": similar
+        }
+    return {"message": f"Added fact: {fact}", "duplicate": False, "similar_to": None}
+
+@app.post("/api/train/fact/remove")
+def remove_fact(request: dict):
+    """Remove a fact from the knowledge base, e.g. one superseded by a correction"""
+    fact = request.get("fact")
+    if not fact:
+        raise HTTPException(status_code=400, detail="Fact is required")
+    if not knowledge_base.remove_fact(fact):
+        raise HTTPException(status_code=404, detail=f"Fact not found: {fact}")
+    return {"message": f"Removed fact: {fact}"}
 
 @app.post("/api/train/example")
-async def train_example(request: dict):
+def train_example(request: dict):
     """Add example conversation"""
     user_message = request.get("userMsg")
     assistant_response = request.get("assistantMsg")
@@ -105,21 +291,61 @@ async def train_example(request: dict):
     knowledge_base.add_example_conversation(user_message, assistant_response)
     return {"message": "Added example conversation"}
 
+@app.post("/api/train/bulk")
+async def train_bulk(request: Request):
+    """Add many entries at once from a JSON array or NDJSON body
+    
+    Each entry has a "type" of qa, fact, example or personality and the same
+    fields as the matching single-item endpoint. Entries are committed with
+    one journal write per BULK_BATCH_SIZE as the body streams in, so at most
+    one batch is held in memory.
+    """
+    totals = {"added": {}, "duplicates": 0, "invalid": 0, "errors": [], "warnings": []}
+    entries = []
+    committed = 0
+    try:
+        async for entry in iter_entries(request.stream()):
+            entries.append(entry)
+            if len(entries) >= BULK_BATCH_SIZE:
+                await run_in_threadpool(_add_bulk_entries, entries, committed, totals)
+                committed += len(entries)
+                entries = []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e} (the first {committed} entries were already processed)")
+    await run_in_threadpool(_add_bulk_entries, entries, committed, totals)
+    
+    total_added = sum(totals["added"].values())
+    return {
+        "message": f"Added {total_added} entries ({totals['duplicates']} duplicates skipped, {totals['invalid']} invalid)",
+        "added": totals["added"],
+        "duplicates": totals["duplicates"],
+        "errors": totals["errors"],
+        "warnings": totals["warnings"]
+    }
+
+def _add_bulk_entries(entries: List[Dict], offset: int, totals: Dict):
+    """Commit one batch of a bulk import and fold its counts into the running totals"""
+    if not entries:
+        return
+    result = knowledge_base.add_entries(entries)
+    for entry_type, added in result["added"].items():
+        totals["added"][entry_type] = totals["added"].get(entry_type, 0) + added
+    totals["duplicates"] += result["duplicates"]
+    totals["invalid"] += len(result["errors"])
+    for error in result["errors"][:max(BULK_MAX_ERRORS - len(totals["errors"]), 0)]:
+        totals["errors"].append({**error, "index": error["index"] + offset})
+    for warning in result["warnings"][:max(BULK_MAX_ERRORS - len(totals["warnings"]), 0)]:
+        totals["warnings"].append({**warning, "index": warning["index"] + offset})
+
 @app.get("/api/train/knowledge")
 async def get_knowledge():
     """Get all training data"""
-    return knowledge_base.knowledge
+    return knowledge_base.export_knowledge()
 
 @app.post("/api/train/clear")
-async def clear_training_data():
+def clear_training_data():
     """Clear all training data"""
-    knowledge_base.knowledge = {
-        "qa_pairs": {},
-        "personality": {},
-        "examples": [],
-        "facts": []
-    }
-    knowledge_base._save_knowledge()
+    knowledge_base.clear()
     return {"message": "Training data cleared successfully"}
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class ChatMessage(BaseModel):
@@ -12,6 +12,7 @@ class ChatRequest(BaseModel):
     """Request model for chat API"""
     message: str
     conversation_history: Optional[List[ChatMessage]] = []
+    session_id: Optional[str] = None  # Omit to start a new session
 
 class ChatResponse(BaseModel):
     """Response model for chat API"""
@@ -19,9 +20,12 @@ class ChatResponse(BaseModel):
     conversation_history: List[ChatMessage]
     model_used: str
     processing_time: float
+    session_id: Optional[str] = None
 
 class HealthResponse(BaseModel):
     """Health check response model"""
     status: str
     timestamp: datetime
     llm_status: str
+    checked_at: Optional[datetime] = None  # When the providers were last probed
+    providers: Dict[str, Dict] = {}
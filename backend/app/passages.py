@@ -0,0 +1,186 @@
+"""
+Passage chunking and storage for scraped website content
+"""
+
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .search_index import BM25Index
+from .shared_files import file_stamp
+
+
+def chunk_page(page: Dict, max_chars: int = 800, overlap: int = 150, min_chars: int = 40) -> Iterator[Dict]:
+    """Split a scraped page into overlapping passages that respect its headings
+
+    The page's extracted headings mark section boundaries in its content.
+    Each section is cut into windows of at most max_chars, ending on a
+    sentence or word boundary where possible. Consecutive windows share
+    about overlap characters so a fact split across a boundary stays
+    retrievable. Passages are yielded one at a time.
+    """
+    content = page.get('content') or ""
+    for start, end, heading in _sections(content, page.get('headings', [])):
+        for offset, text in _windows(content, start, end, max_chars, overlap):
+            if len(text) < min_chars and (offset != 0 or end < len(content)):
+                continue
+            yield {
+                "url": page['url'],
+                "title": page.get('title', ""),
+                "heading": heading,
+                "offset": offset,
+                "text": text
+            }
+
+
+def _sections(content: str, headings: List[Dict]) -> List[Tuple[int, int, Optional[str]]]:
+    """Find (start, end, heading) spans by locating each heading in the content"""
+    boundaries = []
+    search_from = 0
+    for heading in headings:
+        position = content.find(heading['text'], search_from)
+        if position >= 0:
+            boundaries.append((position, heading['text']))
+            search_from = position + len(heading['text'])
+
+    sections = []
+    previous_start, previous_heading = 0, None
+    for position, heading in boundaries:
+        if position > previous_start:
+            sections.append((previous_start, position, previous_heading))
+        previous_start, previous_heading = position, heading
+    if previous_start < len(content):
+        sections.append((previous_start, len(content), previous_heading))
+    return sections
+
+
+def _windows(content: str, start: int, end: int, max_chars: int, overlap: int) -> Iterator[Tuple[int, str]]:
+    """Yield (offset, text) windows over content[start:end]"""
+    while start < end:
+        stop = min(start + max_chars, end)
+        if stop < end:
+            # Prefer ending on a sentence, then on a word, in the back half of the window
+            floor = start + max_chars // 2
+            boundary = max(content.rfind('. ', floor, stop), content.rfind('? ', floor, stop), content.rfind('! ', floor, stop))
+            if boundary >= 0:
+                stop = boundary + 1
+            else:
+                space = content.rfind(' ', floor, stop)
+                if space >= 0:
+                    stop = space
+        text = content[start:stop].strip()
+        if text:
+            yield start, text
+        if stop >= end:
+            break
+        next_start = max(stop - overlap, start + 1)
+        # Start the next window on a word boundary
+        space = content.find(' ', next_start, stop)
+        start = space + 1 if space >= 0 else next_start
+
+
+class PassageStore:
+    """Passages keyed by page URL, searchable with BM25 and persisted as JSON lines"""
+
+    def __init__(self, path: str = "passages.jsonl"):
+        self.path = path
+        self.revision = 0  # Bumped on every save so caches can detect changes
+        self._stamp = None  # Stamp of the file as last read or written by this process
+        self._passages: Dict[str, Dict] = {}
+        self._by_url: Dict[str, List[str]] = {}
+        self._index = BM25Index()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._passages)
+
+    def replace_page(self, url: str, passages: Iterable[Dict]) -> int:
+        """Replace every passage of a page, returning how many were stored"""
+        self.remove_page(url)
+        count = 0
+        for passage in passages:
+            self._add(passage)
+            count += 1
+        return count
+
+    def remove_page(self, url: str):
+        """Remove every passage of a page"""
+        for passage_id in self._by_url.pop(url, []):
+            passage = self._passages.pop(passage_id)
+            self._index.remove(passage_id, self.index_text(passage))
+
+    def clear(self):
+        """Remove every passage"""
+        self._passages.clear()
+        self._by_url.clear()
+        self._index.clear()
+
+    def get(self, passage_id: str) -> Optional[Dict]:
+        """Get a passage by id"""
+        return self._passages.get(passage_id)
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        """Iterate over (passage id, passage) pairs"""
+        return iter(self._passages.items())
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """Return the top-k passages for a query, best first"""
+        return [
+            {**self._passages[passage_id], "id": passage_id, "score": score}
+            for passage_id, score in self._index.search(query, k)
+        ]
+
+    def refresh(self) -> bool:
+        """Reload the passages if another process saved them since this one last read or wrote the file"""
+        if file_stamp(self.path) == self._stamp:
+            return False
+        self.clear()
+        self._load()
+        return True
+
+    def save(self):
+        """Write all passages atomically"""
+        # Never reuse a revision another process already saved, or its caches would mix up the two
+        self.revision = max(self.revision, self._disk_revision()) + 1
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"revision": self.revision}) + "\n")
+            for passage in self._passages.values():
+                f.write(json.dumps(passage, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+        self._stamp = file_stamp(self.path)
+
+    def _disk_revision(self) -> int:
+        """Read the revision of the saved file"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.loads(f.readline() or "{}").get("revision", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _load(self):
+        """Load passages from disk"""
+        self._stamp = file_stamp(self.path)
+        if self._stamp is None:
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline() or "{}")
+            self.revision = header.get("revision", 0)
+            for line in f:
+                if line.strip():
+                    self._add(json.loads(line))
+
+    def _add(self, passage: Dict):
+        """Store and index a single passage"""
+        passage_id = f"{passage['url']}#{passage['offset']}"
+        if passage_id in self._passages:
+            self._index.remove(passage_id, self.index_text(self._passages[passage_id]))
+        else:
+            self._by_url.setdefault(passage['url'], []).append(passage_id)
+        self._passages[passage_id] = passage
+        self._index.add(passage_id, self.index_text(passage))
+
+    @staticmethod
+    def index_text(passage: Dict) -> str:
+        """Text indexed for a passage, including its page title and heading"""
+        return f"{passage.get('title', '')} {passage.get('heading') or ''} {passage['text']}"
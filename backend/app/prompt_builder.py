@@ -0,0 +1,118 @@
+"""
+Prompt assembly shared by the LLM clients
+
+The static prefix (system prompt and personality traits) only changes when
+the knowledge base does, so it is built once per knowledge base version.
+Each request then only assembles the retrieved context, history and message.
+"""
+
+import threading
+from typing import Dict, List, Optional, Set
+
+from .knowledge_base import KnowledgeBase
+from .models import ChatMessage
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from business_config import SYSTEM_PROMPT_TEMPLATE
+
+
+def _passage_key(passage: Dict) -> tuple:
+    """Identify a retrieved passage across turns"""
+    return ("passage", passage["url"], passage["heading"], passage["text"])
+
+
+def _example_key(example: Dict) -> tuple:
+    """Identify a retrieved example conversation across turns"""
+    return ("example", example["user"], example["assistant"])
+
+
+class PromptBuilder:
+    """Builds prompts from a cached static prefix and a per-request suffix"""
+
+    def __init__(self, knowledge_base: KnowledgeBase, system_prompt: str = SYSTEM_PROMPT_TEMPLATE,
+                 retrieval_top_k: int = 5, context_token_budget: int = 1500):
+        self.knowledge_base = knowledge_base
+        self.system_prompt = system_prompt
+        self.retrieval_top_k = retrieval_top_k
+        self.context_token_budget = context_token_budget
+        self._prefix: Optional[str] = None
+        self._prefix_key = None
+        self._lock = threading.Lock()
+
+    def prefix(self) -> str:
+        """Get the system prompt and personality block, rebuilt only when the knowledge base changes
+
+        The same string object is returned until then, so providers can keep
+        a prefix cache keyed on it (Ollama's system prompt, Gemini's system
+        instruction).
+        """
+        key = (self.knowledge_base.version, self.system_prompt)
+        with self._lock:
+            if self._prefix_key != key:
+                parts = [self.system_prompt]
+                personality_traits = self.knowledge_base.get_personality_traits()
+                if personality_traits:
+                    parts.append("PERSONALITY TRAITS:\n" + "".join(
+                        f"- {trait}: {value}\n" for trait, value in personality_traits.items()
+                    ))
+                self._prefix = "\n\n".join(parts)
+                self._prefix_key = key
+            return self._prefix
+
+    def suffix(self, message: str, conversation_history: List[ChatMessage] = None, history_messages: int = 6,
+               sent: Optional[Set[tuple]] = None) -> str:
+        """Build the per-request part: relevant facts, passages, examples, recent history and the message
+
+        When a set of already sent items is given, those are left out and the
+        ones included now are added to it, so a session continuing an earlier
+        context only receives retrieved items it has not seen yet.
+        """
+        retrieved = self.knowledge_base.retrieve_context(
+            message,
+            top_k=self.retrieval_top_k,
+            token_budget=self.context_token_budget
+        )
+        facts = retrieved["facts"]
+        passages = retrieved["passages"]
+        examples = retrieved["examples"]
+        if sent is not None:
+            facts = [fact for fact in facts if ("fact", fact) not in sent]
+            passages = [passage for passage in passages if _passage_key(passage) not in sent]
+            examples = [example for example in examples if _example_key(example) not in sent]
+            sent.update(("fact", fact) for fact in facts)
+            sent.update(_passage_key(passage) for passage in passages)
+            sent.update(_example_key(example) for example in examples)
+        parts = []
+
+        if facts:
+            parts.append("IMPORTANT FACTS:\n")
+            parts.extend(f"- {fact}\n" for fact in facts)
+            parts.append("\n")
+
+        if passages:
+            parts.append("WEBSITE CONTENT:\n")
+            for passage in passages:
+                source = f"{passage['title']} - {passage['heading']}" if passage['heading'] else passage['title']
+                parts.append(f"[{source}] {passage['text']}\n\n")
+
+        if examples:
+            parts.append("EXAMPLE CONVERSATIONS:\n")
+            parts.extend(
+                f"User: {example['user']}\nAssistant: {example['assistant']}\n\n"
+                for example in examples
+            )
+
+        if conversation_history and history_messages:
+            parts.append("CONVERSATION HISTORY:\n")
+            for msg in conversation_history[-history_messages:]:
+                role = "User" if msg.role == "user" else "Assistant"
+                parts.append(f"{role}: {msg.content}\n")
+            parts.append("\n")
+
+        parts.append(f"Please respond to: {message}")
+        return "".join(parts)
+
+    def build(self, message: str, conversation_history: List[ChatMessage] = None, history_messages: int = 6) -> str:
+        """Build the full prompt for providers without a separate system prompt"""
+        return self.prefix() + "\n\n" + self.suffix(message, conversation_history, history_messages)
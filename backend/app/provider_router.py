@@ -0,0 +1,312 @@
+"""
+Health-aware routing between LLM providers
+
+Each provider sits behind a circuit breaker. After repeated failures the
+circuit opens and the provider is skipped without a call, so requests go
+straight to the next provider instead of waiting for a doomed one. Once an
+exponentially growing backoff has passed, a single half-open probe request
+decides whether the circuit closes again.
+"""
+
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .latency import LatencyHistogram
+from .errors import (
+    NoProviderAvailableError, ProviderError, ProviderResponseError, ProviderUnavailableError, QuotaExceededError
+)
+from .models import ChatMessage
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker with exponential backoff and a half-open probe"""
+
+    def __init__(self, failure_threshold: int = 3, base_backoff: float = 5.0, max_backoff: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0  # Consecutive failures while closed
+        self.trips = 0  # Consecutive times the circuit opened without a success in between
+        self.open_until = 0.0
+        self.last_error: Optional[str] = None
+        self._probe_in_flight = False  # Only the probe's own outcome clears this
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to the provider now; claims the probe slot when half-open
+
+        A call admitted while half-open is the probe, and must report back with probe=True.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() >= self.open_until:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def is_available(self) -> bool:
+        """Whether allow_request would currently let a call through, without claiming the probe slot"""
+        with self._lock:
+            if self.state == OPEN:
+                return self.clock() >= self.open_until
+            return self.state == CLOSED or not self._probe_in_flight
+
+    def record_success(self, probe: bool = False):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+            if probe:
+                self._probe_in_flight = False
+
+    def record_failure(self, error: Exception = None, probe: bool = False):
+        """Count a failure, opening the circuit once the threshold is reached or the probe fails"""
+        with self._lock:
+            self.last_error = str(error) if error else None
+            self.failures += 1
+            # A quota error means every call will fail until the provider's window resets
+            if probe or self.failures >= self.failure_threshold or isinstance(error, QuotaExceededError):
+                backoff = min(self.max_backoff, self.base_backoff * (2 ** self.trips))
+                retry_after = getattr(error, "retry_after", None)
+                if retry_after:
+                    backoff = max(backoff, retry_after)
+                self.state = OPEN
+                self.open_until = self.clock() + backoff
+                self.trips += 1
+                self.failures = 0
+            if probe:
+                self._probe_in_flight = False
+
+    def release(self, probe: bool = False):
+        """Give back the probe slot when the probe ended without an outcome, e.g. it was cancelled"""
+        if not probe:
+            return
+        with self._lock:
+            self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit allows a probe"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.open_until - self.clock())
+
+    def snapshot(self) -> Dict:
+        """Describe the breaker's state for diagnostics"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            "last_error": self.last_error
+        }
+
+
+class ProviderRouter:
+    """Sends each request to the first provider whose circuit allows it, in priority order
+
+    With hedging enabled, a provider that has not answered within its latency
+    budget (a percentile of its own recorded latencies) gets company: the next
+    provider is started concurrently, the first success wins and the other
+    call is cancelled. Without hedging the next provider only starts after a
+    failure.
+    """
+
+    def __init__(self, providers: List[Tuple[str, object]], failure_threshold: int = 3,
+                 base_backoff: float = 5.0, max_backoff: float = 300.0, hedge: bool = False,
+                 hedge_percentile: float = 95.0, hedge_min_delay: float = 0.5, hedge_default_delay: float = 3.0,
+                 hedge_min_samples: int = 20):
+        self.providers = [(name, client) for name, client in providers if client is not None]
+        self.breakers = {
+            name: CircuitBreaker(failure_threshold=failure_threshold, base_backoff=base_backoff, max_backoff=max_backoff)
+            for name, _ in self.providers
+        }
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay  # Budget used until a provider has enough samples
+        self.hedge_min_samples = hedge_min_samples
+        # Full-response latency for generate, time to first token for streams
+        self.latency = {
+            name: {"generate": LatencyHistogram(), "first_token": LatencyHistogram()}
+            for name, _ in self.providers
+        }
+        self.hedges_started = 0
+        self.hedges_won = 0
+
+    async def generate(self, message: str, conversation_history: List[ChatMessage] = None,
+                       session_id: Optional[str] = None) -> str:
+        """Generate a response from the first healthy provider, raising ProviderError if none can answer"""
+        async def attempt(client):
+            return await client.generate_response(message, conversation_history, session_id=session_id)
+        
+        _, response = await self._race("generate", attempt)
+        return response
+
+    async def stream(self, message: str, conversation_history: List[ChatMessage] = None,
+                     session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream tokens from the first healthy provider
+
+        Providers race (or fail over) only until the first token; once text has
+        been sent to the caller, a later error is raised to it.
+        """
+        async def attempt(client):
+            stream = client.stream_response(message, conversation_history, session_id=session_id)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.aclose()
+                raise
+        
+        async def discard(result):
+            await result[0].aclose()
+        
+        name, (stream, first_token) = await self._race("first_token", attempt, discard)
+        if first_token is None:
+            return
+        breaker = self.breakers[name]
+        try:
+            yield first_token
+            async for token in stream:
+                yield token
+        except ProviderError as e:
+            breaker.record_failure(e)
+            raise
+        except Exception as e:
+            error = self._unexpected_error(name, e)
+            breaker.record_failure(error)
+            raise error from e
+        finally:
+            await stream.aclose()
+
+    async def _race(self, kind: str, attempt: Callable, discard: Callable = None) -> Tuple[str, object]:
+        """Run attempt(client) against providers in priority order and return (name, result) of the first success
+
+        A failed attempt starts the next provider right away; with hedging, so
+        does an attempt that outlives its latency budget. Attempts still
+        running when a winner is found are cancelled.
+        """
+        candidates = self._candidates()
+        running: Dict[asyncio.Task, Tuple[str, float, bool]] = {}
+        last_error = None
+        hedge_at = None
+        
+        def launch() -> bool:
+            nonlocal hedge_at
+            candidate = next(candidates, None)
+            if candidate is None:
+                hedge_at = None
+                return False
+            name, client, probe = candidate
+            started = time.monotonic()
+            running[asyncio.ensure_future(attempt(client))] = (name, started, probe)
+            hedge_at = started + self._hedge_delay(name, kind) if self.hedge else None
+            return True
+        
+        launch()
+        first_name = next(iter(running.values()))[0] if running else None
+        hedged = False
+        try:
+            while running:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Over budget: start the next provider alongside the slow one
+                    if launch():
+                        hedged = True
+                        self.hedges_started += 1
+                        print(f"Hedging {kind} request: the previous provider is over its latency budget")
+                    continue
+                
+                for task in done:
+                    name, started, probe = running.pop(task)
+                    breaker = self.breakers[name]
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not isinstance(e, ProviderError):
+                            e = self._unexpected_error(name, e)
+                        print(f"{name} failed: {e}")
+                        breaker.record_failure(e, probe=probe)
+                        last_error = e
+                        continue
+                    breaker.record_success(probe=probe)
+                    self.latency[name][kind].record(time.monotonic() - started)
+                    if name != first_name:
+                        self.hedges_won += hedged
+                    return name, result
+                
+                if not running:
+                    launch()
+            raise last_error or self._unavailable()
+        finally:
+            for task, (name, _, probe) in running.items():
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    if discard:
+                        await discard(task.result())
+                    self.breakers[name].record_success(probe=probe)
+                else:
+                    task.cancel()
+                    self.breakers[name].release(probe=probe)
+
+    def preferred_provider(self) -> Optional[str]:
+        """Name of the provider the next request will go to first"""
+        for name, _ in self.providers:
+            if self.breakers[name].is_available():
+                return name
+        return None
+
+    def _hedge_delay(self, name: str, kind: str) -> float:
+        """Latency budget before a request to a provider is hedged"""
+        histogram = self.latency[name][kind]
+        if histogram.count < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, histogram.percentile(self.hedge_percentile))
+
+    def stats(self) -> Dict:
+        """Get each provider's circuit state and latency percentiles"""
+        stats = {
+            name: {
+                **self.breakers[name].snapshot(),
+                "latency": {kind: histogram.snapshot() for kind, histogram in self.latency[name].items()}
+            }
+            for name, _ in self.providers
+        }
+        stats["hedging"] = {"enabled": self.hedge, "started": self.hedges_started, "won": self.hedges_won}
+        return stats
+
+    def _candidates(self):
+        """Yield (name, client, is_probe) in priority order, skipping providers whose circuit is open"""
+        for name, client in self.providers:
+            breaker = self.breakers[name]
+            if breaker.allow_request():
+                yield name, client, breaker.state == HALF_OPEN
+            else:
+                print(f"Skipping {name}: circuit open")
+
+    @staticmethod
+    def _unexpected_error(name: str, error: Exception) -> ProviderError:
+        """Wrap an exception a client did not map itself, so it still counts as a provider failure"""
+        return ProviderResponseError(name, f"unexpected {type(error).__name__}: {error}")
+
+    def _unavailable(self) -> ProviderError:
+        """Build the error raised when every provider was skipped"""
+        if not self.providers:
+            return NoProviderAvailableError("router", "no LLM providers are configured")
+        retry_after = min(breaker.retry_in() for breaker in self.breakers.values())
+        return ProviderUnavailableError("router", "every provider's circuit is open", retry_after=retry_after)
@@ -0,0 +1,84 @@
+"""
+Response cache for repeated questions
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .text_processing import normalize_message
+
+
+class ResponseCache:
+    """LRU cache of responses keyed on normalized message and knowledge base version"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._kb_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, message: str, kb_version: int) -> Optional[str]:
+        """Get a cached response, or None on a miss"""
+        if not self.enabled:
+            return None
+        key = normalize_message(message)
+        with self._lock:
+            self._check_version(kb_version)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, message: str, kb_version: int, response: str):
+        """Cache a response generated against the given knowledge base version"""
+        if not self.enabled:
+            return
+        key = normalize_message(message)
+        with self._lock:
+            if kb_version != self._kb_version:
+                # The knowledge base changed while this response was generated; only get() moves the cache on
+                return
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "kb_version": self._kb_version
+            }
+
+    def _check_version(self, kb_version: int):
+        """Clear the cache whenever the knowledge base version changes, even if it went down"""
+        if kb_version != self._kb_version:
+            self._entries.clear()
+            self._kb_version = kb_version
@@ -0,0 +1,78 @@
+"""
+Inverted index with BM25 ranking for knowledge base search
+"""
+
+import heapq
+import math
+from collections import Counter
+from typing import Dict, Hashable, List, Tuple
+
+from .text_processing import tokenize
+
+
+class BM25Index:
+    """Incrementally updatable inverted index scored with Okapi BM25"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._doc_lengths: Dict[Hashable, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._doc_lengths
+
+    def add(self, doc_id: Hashable, text: str):
+        """Index a document, replacing any previous version with the same id"""
+        if doc_id in self._doc_lengths:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: Hashable, text: str = None):
+        """Remove a document from the index
+
+        Passing the original text avoids scanning every posting list.
+        """
+        if doc_id not in self._doc_lengths:
+            return
+        terms = set(tokenize(text)) if text is not None else list(self._postings)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings and postings.pop(doc_id, None) is not None and not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def clear(self):
+        """Remove every document"""
+        self._postings.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[Hashable, float]]:
+        """Return the top-k (doc_id, score) pairs for a query, best first"""
+        if not self._doc_lengths:
+            return []
+        doc_count = len(self._doc_lengths)
+        average_length = self._total_length / doc_count or 1.0
+        scores: Dict[Hashable, float] = {}
+
+        # Term-at-a-time accumulation only touches documents sharing a query term
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                length_norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
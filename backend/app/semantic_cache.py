@@ -0,0 +1,104 @@
+"""
+Semantic response cache that matches paraphrased questions
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .embeddings import HashingEmbedder
+
+
+class SemanticCache:
+    """Cache that returns a stored response when a new message is similar enough to a cached one
+
+    Embeddings live in a preallocated NumPy matrix used as a ring buffer, so
+    lookups are a single matrix-vector product and the oldest entry is
+    overwritten once the cache is full.
+    """
+
+    def __init__(self, embedder: HashingEmbedder = None, threshold: float = 0.85, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._matrix = np.zeros((max(max_entries, 0), self.embedder.dim), dtype=np.float32)
+        self._responses: List[Optional[str]] = [None] * max(max_entries, 0)
+        self._created: List[float] = [0.0] * max(max_entries, 0)
+        self._size = 0
+        self._next_slot = 0
+        self._kb_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, message: str, kb_version: int) -> Optional[str]:
+        """Get the response cached for the most similar message above the threshold"""
+        if not self.enabled:
+            return None
+        query = self.embedder.embed_one(message)
+        with self._lock:
+            self._check_version(kb_version)
+            if self._size:
+                scores = self._matrix[:self._size] @ query
+                best = int(np.argmax(scores))
+                fresh = not self.ttl_seconds or time.monotonic() - self._created[best] <= self.ttl_seconds
+                if scores[best] >= self.threshold and fresh:
+                    self.hits += 1
+                    return self._responses[best]
+            self.misses += 1
+            return None
+
+    def put(self, message: str, kb_version: int, response: str):
+        """Store a response under the embedding of its message"""
+        if not self.enabled:
+            return
+        vector = self.embedder.embed_one(message)
+        with self._lock:
+            if kb_version != self._kb_version:
+                # The knowledge base changed while this response was generated; only get() moves the cache on
+                return
+            slot = self._next_slot
+            self._matrix[slot] = vector
+            self._responses[slot] = response
+            self._created[slot] = time.monotonic()
+            self._next_slot = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def invalidate(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters, hit rate and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": self._size,
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "kb_version": self._kb_version
+            }
+
+    def _clear(self):
+        """Reset the ring buffer"""
+        self._size = 0
+        self._next_slot = 0
+        self._responses = [None] * max(self.max_entries, 0)
+
+    def _check_version(self, kb_version: int):
+        """Clear the cache whenever the knowledge base version changes, even if it went down"""
+        if kb_version != self._kb_version:
+            self._clear()
+            self._kb_version = kb_version
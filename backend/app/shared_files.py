@@ -0,0 +1,96 @@
+"""
+Helpers for files shared between worker processes
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; a single process needs no locking
+    fcntl = None
+
+FileStamp = Tuple[int, int, int]
+
+
+def file_stamp(path: str) -> Optional[FileStamp]:
+    """Identify a file's current contents by inode, modification time and size, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class FileLock:
+    """Reentrant advisory lock on a file, shared for readers and exclusive for writers
+
+    Every process that opens the same path contends for the same lock. Inside
+    an exclusive hold, further shared or exclusive requests just nest.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._depth = 0
+        self._exclusive = False
+
+    @property
+    def held_exclusive(self) -> bool:
+        return self._depth > 0 and self._exclusive
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the lock exclusively for the duration of the block"""
+        with self._hold(exclusive=True):
+            yield
+
+    @contextmanager
+    def shared(self):
+        """Hold the lock shared with other readers for the duration of the block"""
+        with self._hold(exclusive=False) as acquired:
+            yield acquired
+
+    @contextmanager
+    def try_shared(self):
+        """Hold the lock shared if no writer holds it, yielding whether it was taken, without waiting"""
+        with self._hold(exclusive=False, blocking=False) as acquired:
+            yield acquired
+
+    @contextmanager
+    def _hold(self, exclusive: bool, blocking: bool = True):
+        """Take the lock on the outermost entry and release it on the outermost exit, yielding whether it is held"""
+        if self._depth > 0:
+            if exclusive and not self._exclusive:
+                raise RuntimeError(f"Cannot upgrade a shared lock on {self.path} to exclusive")
+            self._depth += 1
+            try:
+                yield True
+            finally:
+                self._depth -= 1
+            return
+
+        if fcntl is not None:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            try:
+                fcntl.flock(self._file.fileno(), operation if blocking else operation | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+        self._depth = 1
+        self._exclusive = exclusive
+        try:
+            yield True
+        finally:
+            self._depth = 0
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        """Close the lock file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,106 @@
+"""
+Single-flight coalescing of identical in-flight requests
+"""
+
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+
+class Broadcast:
+    """Output of one in-flight generation that any number of subscribers can follow
+
+    Chunks are kept until the generation ends, so a subscriber that attaches
+    late first replays what it missed and then follows along live.
+    """
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str):
+        """Append a chunk and wake the subscribers"""
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: BaseException = None):
+        """Mark the generation complete, or failed with the error every subscriber will see"""
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yield every chunk from the start, raising the generation's error if it failed"""
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    async def result(self) -> str:
+        """Wait for the generation to finish and return its full text"""
+        return "".join([chunk async for chunk in self.subscribe()])
+
+    def _notify(self):
+        """Wake everyone waiting on the current event and start a fresh one"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class SingleFlight:
+    """Runs at most one generation per key at a time and shares its output with every caller
+
+    The generation runs in its own task, so it finishes (and can be cached)
+    even if the caller that started it goes away.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, Broadcast] = {}
+        self._tasks: Set[asyncio.Task] = set()  # The event loop only keeps weak references to tasks
+
+    def join(self, key: Hashable, produce: Callable[[Broadcast], Awaitable[None]]) -> Broadcast:
+        """Get the in-flight broadcast for a key, starting produce(broadcast) if there is none
+
+        produce publishes chunks; raising from it fails the broadcast.
+        """
+        broadcast = self._flights.get(key)
+        if broadcast is not None:
+            self.coalesced += 1
+            return broadcast
+
+        broadcast = Broadcast()
+        self._flights[key] = broadcast
+        self.started += 1
+
+        async def run():
+            try:
+                await produce(broadcast)
+            except BaseException as e:
+                broadcast.finish(e)
+                if not isinstance(e, Exception):
+                    raise
+            else:
+                broadcast.finish()
+            finally:
+                self._flights.pop(key, None)
+
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return broadcast
+
+    def stats(self) -> Dict:
+        """Get flight counters"""
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
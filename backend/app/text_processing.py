@@ -0,0 +1,39 @@
+"""
+Text normalization and tokenization shared by caches and search
+"""
+
+import re
+from typing import List
+
+_APOSTROPHES = re.compile(r"['’]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Common English words that carry no meaning for matching questions
+STOP_WORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not of off on once only or other our ours out over
+own same she should so some such than that the their theirs them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message so trivially different phrasings share a key"""
+    text = _APOSTROPHES.sub("", message.lower())
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def tokenize(text: str, remove_stop_words: bool = True) -> List[str]:
+    """Split text into normalized word tokens"""
+    tokens = normalize_message(text).split()
+    if remove_stop_words:
+        return [token for token in tokens if token not in STOP_WORDS]
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate LLM tokens for a text, at about four characters per token"""
+    return len(text) // 4 + 1
@@ -0,0 +1,276 @@
+"""
+Memory-mapped vector index for semantic search over the knowledge base
+
+Vectors are stored in a preallocated NumPy .npy file that is opened with
+mmap, so every worker process maps the same pages instead of holding its
+own copy. Metadata (row count, keys, idf weights) lives in a JSON file
+beside it and is written after the rows, so a reader never sees a row
+count larger than what is on disk.
+
+update() embeds and saves under a file lock, so processes sharing the
+index take turns and each one adopts the rows the others already saved.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embeddings import HashingEmbedder
+from .shared_files import FileLock, file_stamp
+
+# Key of an indexed item: (kind, id) such as ("fact", "..."), ("qa", question) or ("passage", passage_id)
+VectorKey = Tuple[str, str]
+
+
+class VectorIndex:
+    """Cosine top-k index with memory-mapped storage and incremental append
+
+    Rows loaded from disk stay in the read-only mapping; rows added since
+    the last save are kept in an in-memory tail until save() writes them
+    into the file's spare capacity. Removed rows become tombstones until
+    the index is rebuilt or the file grows.
+    """
+
+    def __init__(self, path: str = "knowledge_base.vectors", embedder: HashingEmbedder = None, block_rows: int = 32768):
+        self.path = path
+        self.matrix_path = path + ".npy"
+        self.meta_path = path + ".json"
+        self.embedder = embedder or HashingEmbedder()
+        self.block_rows = block_rows  # Rows scored per matrix product, bounding temporary memory
+        self.version = None  # Knowledge base version the index was last synced to
+        self._base: Optional[np.ndarray] = None
+        self._base_count = 0
+        self._tail = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._tail_count = 0
+        self._keys: List[Optional[VectorKey]] = []
+        self._rows: Dict[VectorKey, int] = {}
+        self._saved_keys = 0
+        self._removed_since_save = False
+        self._masks: Dict[Optional[Tuple[str, ...]], np.ndarray] = {}
+        self._meta_stamp = None  # Stamp of the metadata file as last read or written
+        self._lock = threading.Lock()  # Held while rows change, so a search on another thread skips instead of reading them
+        self._file_lock = FileLock(path + ".lock")
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: VectorKey) -> bool:
+        return key in self._rows
+
+    @property
+    def dirty(self) -> bool:
+        """Whether there are rows or removals not yet saved"""
+        return self._tail_count > 0 or self._saved_keys != len(self._keys) or self._removed_since_save
+
+    def add(self, items: Dict[VectorKey, str]):
+        """Embed and append items whose keys are not indexed yet"""
+        new_items = [(key, text) for key, text in items.items() if key not in self._rows]
+        if not new_items:
+            return
+        vectors = self.embedder.embed([text for _, text in new_items])
+        needed = self._tail_count + len(new_items)
+        if needed > len(self._tail):
+            grown = np.zeros((max(needed, 2 * len(self._tail), 64), self.embedder.dim), dtype=np.float32)
+            grown[:self._tail_count] = self._tail[:self._tail_count]
+            self._tail = grown
+        self._tail[self._tail_count:needed] = vectors
+        self._tail_count = needed
+        for key, _ in new_items:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+        self._masks.clear()
+
+    def remove(self, keys: Sequence[VectorKey]):
+        """Tombstone items so they are never returned by search"""
+        for key in keys:
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._keys[row] = None
+                self._removed_since_save = True
+                self._masks.clear()
+
+    def sync(self, items: Dict[VectorKey, str], version: int = None):
+        """Make the index match a set of items, embedding only the ones that are new"""
+        self.remove([key for key in self._rows if key not in items])
+        self.add(items)
+        self.version = version
+
+    def update(self, items: Dict[VectorKey, str], version: int = None):
+        """Adopt rows other processes saved, embed the items still missing and save, safe to call from a worker thread"""
+        with self._file_lock.exclusive(), self._lock:
+            self.refresh()
+            self.sync(items, version)
+            self.save()
+
+    def refresh(self):
+        """Reload the index if another process saved it since this one last read or wrote it"""
+        if file_stamp(self.meta_path) != self._meta_stamp:
+            self._load()
+
+    def rebuild(self, items: Dict[VectorKey, str], fit_idf: bool = True, version: int = None):
+        """Re-embed every item from scratch, optionally refitting idf weights, and save"""
+        with self._file_lock.exclusive(), self._lock:
+            self._rebuild(items, fit_idf, version)
+
+    def _rebuild(self, items: Dict[VectorKey, str], fit_idf: bool, version: Optional[int]):
+        """Re-embed and save; needs both locks"""
+        if fit_idf:
+            self.embedder.fit_idf(items.values())
+        self._base = None
+        self._base_count = 0
+        self._tail = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._tail_count = 0
+        self._keys = []
+        self._rows = {}
+        self._masks.clear()
+        self.add(items)
+        self.version = version
+        self.save(rewrite=True)
+
+    def search(self, query: str, k: int = 5, kinds: Sequence[str] = None) -> List[Tuple[VectorKey, float]]:
+        """Return the top-k (key, cosine score) pairs for a query"""
+        return self.search_batch([query], k, kinds)[0]
+
+    def search_batch(self, queries: Sequence[str], k: int = 5, kinds: Sequence[str] = None) -> List[List[Tuple[VectorKey, float]]]:
+        """Score many queries at once with blocked matrix products and return each one's top-k
+        
+        Returns no results, rather than waiting, while update() is changing the rows.
+        """
+        if not queries:
+            return []
+        if not self._lock.acquire(blocking=False):
+            return [[] for _ in queries]
+        try:
+            return self._search_batch(queries, k, kinds)
+        finally:
+            self._lock.release()
+
+    def _search_batch(self, queries: Sequence[str], k: int, kinds: Optional[Sequence[str]]) -> List[List[Tuple[VectorKey, float]]]:
+        """Score queries against the rows; needs the lock"""
+        if not self._rows or k <= 0:
+            return [[] for _ in queries]
+        query_matrix = self.embedder.embed(queries)
+        allowed = self._allowed_rows(kinds)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for offset, block in self._blocks():
+            scores = query_matrix @ block.T
+            scores[:, ~allowed[offset:offset + len(block)]] = -np.inf
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(offset, offset + len(block)), scores.shape)], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            results.append([
+                (self._keys[rows[i]], float(scores[i]))
+                for i in order if np.isfinite(scores[i]) and scores[i] > 0
+            ])
+        return results
+
+    def save(self, rewrite: bool = False):
+        """Write new rows into the file's spare capacity, growing the file when it is full"""
+        total = len(self._keys)
+        capacity = len(self._base) if self._base is not None else 0
+        tombstones = total - len(self._rows)
+        if rewrite or total > capacity or tombstones > total // 2:
+            self._rewrite()
+        elif self._tail_count:
+            # Rows past the saved count are unused capacity, so writing them is invisible to readers
+            matrix = np.load(self.matrix_path, mmap_mode="r+")
+            matrix[self._base_count:total] = self._tail[:self._tail_count]
+            matrix.flush()
+            del matrix
+        self._write_meta(len(self._keys))
+        self._map(len(self._keys))
+
+    def _rewrite(self):
+        """Write a compacted file with room to grow and swap it in atomically"""
+        live_rows = [row for row, key in enumerate(self._keys) if key is not None]
+        vectors = np.concatenate([block for _, block in self._blocks()] or [self._tail[:0]])[live_rows]
+        self._keys = [self._keys[row] for row in live_rows]
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._masks.clear()
+
+        capacity = max(2 * len(live_rows), 1024)
+        temp_path = self.matrix_path + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=(capacity, self.embedder.dim))
+        matrix[:len(live_rows)] = vectors
+        matrix.flush()
+        del matrix
+        os.replace(temp_path, self.matrix_path)
+
+    def _write_meta(self, count: int):
+        """Write the row count, keys and idf weights atomically"""
+        meta = {
+            "count": count,
+            "dim": self.embedder.dim,
+            "version": self.version,
+            "keys": self._keys[:count],
+            "idf": self.embedder.idf.tolist() if self.embedder.idf is not None else None
+        }
+        temp_path = self.meta_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, self.meta_path)
+        self._meta_stamp = file_stamp(self.meta_path)
+
+    def _load(self):
+        """Map a saved index, ignoring it if it does not match the embedder"""
+        self._meta_stamp = file_stamp(self.meta_path)
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.meta_path)):
+            return
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta["dim"] != self.embedder.dim:
+                return
+            if meta["idf"] is not None:
+                self.embedder.idf = np.asarray(meta["idf"], dtype=np.float32)
+            self._keys = [tuple(key) if key is not None else None for key in meta["keys"]]
+            self._rows = {key: row for row, key in enumerate(self._keys) if key is not None}
+            self.version = meta.get("version")
+            self._map(meta["count"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading vector index: {e}")
+            self._keys = []
+            self._rows = {}
+            self._base = None
+            self._base_count = 0
+
+    def _map(self, count: int):
+        """Memory-map the saved rows read-only and reset the in-memory tail"""
+        self._base = np.load(self.matrix_path, mmap_mode="r")
+        self._base_count = count
+        self._tail_count = 0
+        self._saved_keys = count
+        self._removed_since_save = False
+        self._masks.clear()
+
+    def _blocks(self):
+        """Yield (first row, rows) blocks over saved rows followed by the in-memory tail"""
+        for start in range(0, self._base_count, self.block_rows):
+            yield start, self._base[start:min(start + self.block_rows, self._base_count)]
+        for start in range(0, self._tail_count, self.block_rows):
+            yield self._base_count + start, self._tail[start:min(start + self.block_rows, self._tail_count)]
+
+    def _allowed_rows(self, kinds: Optional[Sequence[str]]) -> np.ndarray:
+        """Boolean mask of live rows, optionally restricted to some kinds, cached until the next change"""
+        cache_key = tuple(kinds) if kinds is not None else None
+        mask = self._masks.get(cache_key)
+        if mask is None:
+            mask = np.fromiter(
+                (key is not None and (kinds is None or key[0] in kinds) for key in self._keys),
+                dtype=bool,
+                count=len(self._keys)
+            )
+            self._masks[cache_key] = mask
+        return mask
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark HTML parsing backends for the website scraper
+
+The saved kiatech_website_content.json keeps extracted text rather than raw
+HTML, so each page is rebuilt into a representative document (navigation,
+scripts, headings, paragraphs and links) before parsing.
+"""
+import argparse
+import html
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from website_trainer import available_parser_backends, parse_html
+
+def build_html(page: dict) -> str:
+    """Rebuild a page document from scraped content"""
+    words = page['content'].split()
+    paragraphs = [' '.join(words[i:i + 60]) for i in range(0, len(words), 60)]
+    headings = page.get('headings', [])
+    
+    body = []
+    for index, paragraph in enumerate(paragraphs):
+        if index < len(headings):
+            heading = headings[index]
+            body.append(f"<{heading['level']}>{html.escape(heading['text'])}</{heading['level']}>")
+        body.append(f"<p>{html.escape(paragraph)}</p>")
+    links = ''.join(
+        f'<li><a href="{html.escape(link["url"])}">{html.escape(link["text"])}</a></li>'
+        for link in page.get('links', [])
+    )
+    return (
+        f"<html><head><title>{html.escape(page['title'])}</title>"
+        "<style>body { font-family: sans-serif; }</style>"
+        "<script>window.dataLayer = window.dataLayer || [];</script></head><body>"
+        "<header><nav><ul><li><a href='/'>Home</a></li><li><a href='/Home/AboutUs'>About Us</a></li></ul></nav></header>"
+        f"<main>{''.join(body)}<ul>{links}</ul></main>"
+        "<footer>Copyright Kiatech Software. All rights reserved. Privacy Policy</footer>"
+        "</body></html>"
+    )
+
+def parse_document(args):
+    """Parse one document; a top-level function so it can run in a process pool"""
+    url, document, domain, backend = args
+    return parse_html(url, document, domain, backend)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-page parse time across HTML parser backends")
+    parser.add_argument("--input", default="kiatech_website_content.json", help="Saved scraper output")
+    parser.add_argument("--repeat", type=int, default=50, help="Times each page is parsed per backend")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Processes for the pool comparison")
+    args = parser.parse_args()
+    
+    with open(args.input, 'r', encoding='utf-8') as f:
+        pages = json.load(f)
+    documents = [(page['url'], build_html(page), urlparse(page['url']).netloc) for page in pages]
+    average_size = sum(len(document) for _, document, _ in documents) / len(documents)
+    print(f"{len(documents)} pages, average {average_size / 1024:.1f} KiB, {args.repeat} repeats")
+    print(f"{'backend':<14}{'ms/page':>10}{'pool ms/page':>15}  content matches html.parser")
+    
+    reference = {url: parse_html(url, document, domain)['content'] for url, document, domain in documents}
+    for backend in available_parser_backends():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            results = [parse_html(url, document, domain, backend) for url, document, domain in documents]
+        serial = (time.perf_counter() - start) * 1000 / (args.repeat * len(documents))
+        
+        jobs = [(url, document, domain, backend) for url, document, domain in documents] * args.repeat
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(parse_document, jobs[:args.workers]))  # Warm up the worker processes
+            start = time.perf_counter()
+            list(pool.map(parse_document, jobs, chunksize=8))
+            pooled = (time.perf_counter() - start) * 1000 / len(jobs)
+        
+        matches = all(result['content'] == reference[result['url']] for result in results)
+        print(f"{backend:<14}{serial:>10.3f}{pooled:>15.3f}  {'yes' if matches else 'no'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Rebuild the knowledge base vector index from scratch
+
+The trainer and the server's background thread only embed items added
+since the index was last saved, so a full rebuild is needed to refit idf weights after large training runs or
+to reclaim space left by removed items.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from app.knowledge_base import KnowledgeBase
+
+def main():
+    """Re-embed every fact, QA question and passage and save the index"""
+    parser = argparse.ArgumentParser(description="Rebuild the knowledge base vector index")
+    parser.add_argument("--knowledge-base", default="knowledge_base.json", help="Knowledge base snapshot to index")
+    parser.add_argument("--no-idf", action="store_true", help="Keep raw hashed term weights instead of refitting idf")
+    parser.add_argument("--query", action="append", default=[], help="Query to run against the rebuilt index (repeatable)")
+    args = parser.parse_args()
+
+    knowledge_base = KnowledgeBase(args.knowledge_base)
+    items = knowledge_base.vector_items()
+    print(f"Embedding {len(items)} items from {args.knowledge_base}...")
+
+    start = time.perf_counter()
+    knowledge_base.vectors.rebuild(items, fit_idf=not args.no_idf, version=knowledge_base.version)
+    elapsed = time.perf_counter() - start
+    print(f"✓ Saved {len(knowledge_base.vectors)} vectors to {knowledge_base.vectors.matrix_path} in {elapsed:.2f}s")
+
+    for query, results in zip(args.query, knowledge_base.vectors.search_batch(args.query, k=3)):
+        print(f"\n🔎 {query}")
+        for (kind, key), score in results:
+            print(f"  {score:.3f} [{kind}] {key[:80]}")
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ load_dotenv("config.env")
 PRODUCTION = os.getenv("PRODUCTION", "false").lower() == "true"
 PORT = int(os.getenv("PORT", 8000))
 HOST = os.getenv("HOST", "0.0.0.0")
+# Worker processes - with more than one, workers share the knowledge base through its
+# file-locked journal and conversations through SQLite
+WORKERS = int(os.getenv("WORKERS", 1))
 
 # LLM Provider selection - default to gemini for production deployments
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini" if PRODUCTION else "ollama")  # "ollama" or "gemini"
@@ -18,16 +21,79 @@ LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini" if PRODUCTION else "ollama")
 # Ollama settings (you'll need to set these in production)
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
+# Ollama connection pool - the read timeout applies between streamed chunks, and requests
+# wait at most the pool timeout for a free connection
+OLLAMA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", 5))
+OLLAMA_READ_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_READ_TIMEOUT_SECONDS", 120))
+OLLAMA_POOL_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_POOL_TIMEOUT_SECONDS", 10))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", 20))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", 10))
+OLLAMA_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY_SECONDS", 30))
+OLLAMA_HTTP2 = os.getenv("OLLAMA_HTTP2", "false").lower() == "true"  # Needs the h2 package
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # How long Ollama keeps the model and prompt cache loaded
+OLLAMA_CONTEXT_SESSIONS = int(os.getenv("OLLAMA_CONTEXT_SESSIONS", 500))  # Sessions whose token context is kept for the next turn
+OLLAMA_MAX_CONTEXT_TOKENS = int(os.getenv("OLLAMA_MAX_CONTEXT_TOKENS", 4096))  # Longer contexts fall back to a full prompt
 
 # Gemini settings
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))  # Concurrent Gemini calls per worker
+
+# Circuit breaker per LLM provider - consecutive failures before a provider is skipped,
+# and the backoff before a probe request, doubling on every failed probe up to the maximum
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_BASE_BACKOFF_SECONDS = float(os.getenv("CIRCUIT_BASE_BACKOFF_SECONDS", 5))
+CIRCUIT_MAX_BACKOFF_SECONDS = float(os.getenv("CIRCUIT_MAX_BACKOFF_SECONDS", 300))
+
+# Hedged requests - when the primary provider is slower than this percentile of its own
+# recorded latency, the fallback is started concurrently and the first answer wins
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", 0.5))
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", 3))  # Until enough latencies are recorded
+
+# Admission control - concurrent requests admitted per provider (Gemini uses GEMINI_MAX_CONCURRENCY),
+# and how many more may wait, for how long, before getting 429/503 with Retry-After
+OLLAMA_MAX_CONCURRENT_REQUESTS = int(os.getenv("OLLAMA_MAX_CONCURRENT_REQUESTS", 2))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 50))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 30))
+
+# Background provider health probes - seconds between rounds and per-probe timeout
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", 30))
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", 5))
+
+# Conversation storage - "memory" (per process) or "sqlite" (shared file)
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory")
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", 1000))
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", 3600))
+MAX_CONVERSATION_HISTORY = int(os.getenv("MAX_CONVERSATION_HISTORY", 20))  # Messages kept per session
+if WORKERS > 1 and CONVERSATION_BACKEND == "memory":
+    # A session's turns can land on any worker, so history must live outside the process
+    print("Multiple workers: storing conversations in SQLite so every worker sees them")
+    CONVERSATION_BACKEND = "sqlite"
+
+# Response cache for repeated opening questions (size 0 disables it)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600))
+
+# Semantic cache matches paraphrases by cosine similarity of local embeddings
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1000))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.8))
+
+# Retrieval settings - only the most relevant knowledge is added to each prompt
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 5))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))  # Approximate tokens for facts and examples
+
+# Hot reload - seconds between checks of the knowledge base snapshot and business_config.py
+# for edits, which are loaded in the background and swapped in (0 disables watching)
+HOT_RELOAD_INTERVAL_SECONDS = float(os.getenv("HOT_RELOAD_INTERVAL_SECONDS", 2))
 
 # Knowledge base file path
 KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", "knowledge_base.json")
 
 print(f"Starting in {'PRODUCTION' if PRODUCTION else 'DEVELOPMENT'} mode")
-print(f"Host: {HOST}, Port: {PORT}")
+print(f"Host: {HOST}, Port: {PORT}, Workers: {WORKERS}")
 print(f"LLM Provider: {LLM_PROVIDER}")
 if LLM_PROVIDER == "ollama":
     print(f"Ollama URL: {OLLAMA_URL}")
@@ -13,7 +13,7 @@ sys.path.insert(0, str(current_dir))
 
 if __name__ == "__main__":
     import uvicorn
-    from app.main import app
+    from config import WORKERS
     
     print("Starting LLM ChatBot Server...")
     print("Web interface: http://localhost:8000")
@@ -27,7 +27,9 @@ if __name__ == "__main__":
             "app.main:app",
             host="0.0.0.0",
             port=8000,
-            reload=True,
+            # Auto-reload runs a single process, so it is only used without extra workers
+            reload=WORKERS == 1,
+            workers=WORKERS,
             log_level="info"
         )
     except KeyboardInterrupt:
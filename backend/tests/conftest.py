@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the backend the same way the app does, as the "app" package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,120 @@
+"""
+Crash and concurrency behaviour of the knowledge base journal
+"""
+
+import json
+import threading
+
+import pytest
+
+from app.knowledge_base import KnowledgeBase
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    return str(tmp_path / "knowledge_base.json")
+
+
+def open_kb(path: str, **options) -> KnowledgeBase:
+    """Open a knowledge base the way a restarted worker would, without fsync or vectors"""
+    options.setdefault("compact_threshold", 10000)
+    return KnowledgeBase(path, fsync=False, vector_search=False, **options)
+
+
+def journal_entries(path: str):
+    """Read the journal entries from disk"""
+    with open(path + ".journal", "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_replay_after_restart(kb_path):
+    kb = open_kb(kb_path)
+    kb.add_qa_pair("what are your hours?", "9am to 5pm")
+    kb.add_personality_trait("tone", "friendly")
+    kb.add_fact("The office is in Springfield")
+    kb.add_fact("Parking is free for customers")
+    kb.add_example_conversation("Hi", "Hello! How can I help?")
+    kb.remove_fact("Parking is free for customers")
+
+    restarted = open_kb(kb_path)
+    assert restarted.export_knowledge() == kb.export_knowledge()
+    assert restarted.get_facts() == ["The office is in Springfield"]
+    assert restarted.get_answer("what are your hours?") == "9am to 5pm"
+    assert restarted.version == kb.version
+
+    # New changes continue the sequence instead of reusing numbers
+    restarted.add_fact("Deliveries arrive on Mondays")
+    seqs = [entry["seq"] for entry in journal_entries(kb_path)]
+    assert seqs == sorted(set(seqs))
+
+
+def test_torn_final_line_is_ignored_and_truncated(kb_path):
+    kb = open_kb(kb_path)
+    kb.add_fact("The office is in Springfield")
+    kb.add_fact("Parking is free for customers")
+    with open(kb_path + ".journal", "a", encoding="utf-8") as f:
+        f.write('{"seq": 3, "op": "fact", "fact": "Half writ')
+
+    restarted = open_kb(kb_path)
+    assert restarted.get_facts() == ["The office is in Springfield", "Parking is free for customers"]
+
+    # The next writer cuts the torn tail before appending, so later entries stay readable
+    restarted.add_fact("Deliveries arrive on Mondays")
+    entries = journal_entries(kb_path)
+    assert [entry["seq"] for entry in entries] == [1, 2, 3]
+    assert entries[-1]["fact"] == "Deliveries arrive on Mondays"
+    assert open_kb(kb_path).get_facts() == restarted.get_facts()
+
+
+def test_crash_between_snapshot_and_journal_trim(kb_path):
+    kb = open_kb(kb_path)
+    kb.add_fact("The office is in Springfield")
+    kb.add_example_conversation("Hi", "Hello! How can I help?")
+    kb.add_qa_pair("what are your hours?", "9am to 5pm")
+    with open(kb_path + ".journal", "rb") as f:
+        old_journal = f.read()
+    kb.compact()
+    # Put the untrimmed journal back, as if the process died right after writing the snapshot
+    with open(kb_path + ".journal", "wb") as f:
+        f.write(old_journal)
+
+    restarted = open_kb(kb_path)
+    assert restarted.get_facts() == ["The office is in Springfield"]
+    assert restarted.get_example_conversations() == [{"user": "Hi", "assistant": "Hello! How can I help?"}]
+    assert restarted.version == kb.version
+    assert not restarted.snapshot_edited
+
+    restarted.add_fact("Parking is free for customers")
+    assert open_kb(kb_path).get_facts() == ["The office is in Springfield", "Parking is free for customers"]
+
+
+def test_two_instances_interleave_writes(kb_path):
+    first = open_kb(kb_path)
+    second = open_kb(kb_path)
+    first.add_fact("Fact from the first instance")
+    second.add_fact("Fact from the second instance")
+    first.add_fact("Another fact from the first instance")
+    assert first.get_facts() == [
+        "Fact from the first instance",
+        "Fact from the second instance",
+        "Another fact from the first instance"
+    ]
+
+    def write(kb: KnowledgeBase, name: str):
+        for i in range(50):
+            kb.add_fact(f"{name} fact number {i}")
+
+    threads = [
+        threading.Thread(target=write, args=(first, "first")),
+        threading.Thread(target=write, args=(second, "second"))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    seqs = [entry["seq"] for entry in journal_entries(kb_path)]
+    assert seqs == list(range(1, 104))
+    facts = open_kb(kb_path).get_facts()
+    assert len(facts) == 103
+    assert set(facts) == set(first.get_facts()) | set(second.get_facts())
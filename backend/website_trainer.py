@@ -4,66 +4,288 @@ Website Content Scraper and Trainer for Kiatech Software Chatbot
 Automatically scrapes website content and trains the chatbot
 """
 import requests
+import httpx
+import asyncio
+import argparse
 from bs4 import BeautifulSoup
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import json
 import time
 import re
+import hashlib
 from urllib.parse import urljoin, urlparse
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from app.knowledge_base import KnowledgeBase
+from app.passages import chunk_page
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Known pages crawled in addition to links discovered from the home page
+DEFAULT_SEED_PATHS = [
+    "/Home/AboutUs",
+    "/Home/ContactUs",
+    "/Product",  # EIMS product page
+    "/Home/Products",  # Products page
+    "/Home/Services",  # Services page
+    "/Home/Portfolio",  # Portfolio page
+]
+
+class HostRateLimiter:
+    """Per-host politeness: caps concurrent requests and spaces out request starts"""
+    
+    def __init__(self, min_interval: float = 1.0, max_per_host: int = 2):
+        self.min_interval = min_interval
+        self.max_per_host = max_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_start: Dict[str, float] = {}
+    
+    async def acquire(self, host: str):
+        """Wait until a request to the host is allowed to start"""
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_per_host))
+        await semaphore.acquire()
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next_start.get(host, 0.0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start[host] = loop.time() + self.min_interval
+    
+    def release(self, host: str):
+        """Mark a request to the host as finished"""
+        self._semaphores[host].release()
+
+# Navigation and footer boilerplate, compiled once into a single alternation
+UNWANTED_TEXT = re.compile(
+    r'cookie policy|privacy policy|terms of service|follow us on|subscribe to|newsletter|copyright|all rights reserved',
+    re.IGNORECASE
+)
+WHITESPACE = re.compile(r'\s+')
+SKIPPED_EXTENSIONS = ('.pdf', '.jpg', '.png', '.gif', '.css', '.js', '.xml', '.zip')
+CONTENT_SELECTORS = [
+    'main', 'article', '.content', '.main-content',
+    '.page-content', '#content', '.container'
+]
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+REMOVED_TAGS = ["script", "style", "nav", "footer", "header"]
+
+def clean_text(text: str) -> str:
+    """Clean and normalize text content"""
+    if not text:
+        return ""
+    
+    # Remove extra whitespace and common navigation and footer text
+    text = WHITESPACE.sub(' ', text.strip())
+    text = UNWANTED_TEXT.sub('', text)
+    return text.strip()
+
+def is_valid_url(url: str, domain: str) -> bool:
+    """Check if URL is valid and belongs to the given domain"""
+    try:
+        parsed = urlparse(url)
+        lowered = url.lower()
+        return (
+            parsed.netloc == domain and
+            not any(ext in lowered for ext in SKIPPED_EXTENSIONS) and
+            '#' not in url
+        )
+    except:
+        return False
+
+def available_parser_backends() -> List[str]:
+    """List the HTML parser backends that can be used in this environment"""
+    backends = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        backends.append('lxml')
+    except ImportError:
+        pass
+    try:
+        import selectolax  # noqa: F401
+        backends.append('selectolax')
+    except ImportError:
+        pass
+    return backends
+
+def parse_html(url: str, html, domain: str, backend: str = 'html.parser') -> Optional[Dict]:
+    """Extract title, cleaned content, headings and links from a page
+    
+    This is a module-level function so it can run in a process pool.
+    The backend is 'html.parser' or 'lxml' (both through BeautifulSoup)
+    or 'selectolax', which is much faster on large pages.
+    """
+    try:
+        if backend == 'selectolax':
+            title_text, main_content, raw_headings, raw_links = _extract_with_selectolax(html)
+        else:
+            title_text, main_content, raw_headings, raw_links = _extract_with_beautifulsoup(html, backend)
+        
+        # Clean the content
+        cleaned_content = clean_text(main_content)
+        
+        # Extract headings for structure
+        headings = []
+        for level, text in raw_headings:
+            heading_text = clean_text(text)
+            if heading_text and len(heading_text) > 3:
+                headings.append({
+                    'level': level,
+                    'text': heading_text
+                })
+        
+        # Extract links for further crawling
+        links = []
+        for href, text in raw_links:
+            full_url = urljoin(url, href)
+            if is_valid_url(full_url, domain):
+                link_text = clean_text(text)
+                if link_text and len(link_text) > 2:
+                    links.append({
+                        'url': full_url,
+                        'text': link_text
+                    })
+        
+        return {
+            'url': url,
+            'title': title_text,
+            'content': cleaned_content,
+            'headings': headings,
+            'links': links,
+            'word_count': len(cleaned_content.split()),
+            'scraped_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        
+    except Exception as e:
+        print(f"Error parsing {url}: {e}")
+        return None
+
+def _extract_with_beautifulsoup(html, backend: str):
+    """Pull raw title, content, headings and links out of a page with BeautifulSoup"""
+    soup = BeautifulSoup(html, backend)
+    
+    # Remove script and style elements
+    for element in soup(REMOVED_TAGS):
+        element.decompose()
+    
+    title = soup.find('title')
+    title_text = title.get_text().strip() if title else "No Title"
+    
+    main_content = ""
+    for selector in CONTENT_SELECTORS:
+        content_elem = soup.select_one(selector)
+        if content_elem:
+            main_content = content_elem.get_text()
+            break
+    
+    if not main_content:
+        # Fallback to body content
+        body = soup.find('body')
+        if body:
+            main_content = body.get_text()
+    
+    headings = [(tag.name, tag.get_text()) for tag in soup.find_all(HEADING_TAGS)]
+    links = [(link['href'], link.get_text()) for link in soup.find_all('a', href=True)]
+    return title_text, main_content, headings, links
+
+def _extract_with_selectolax(html):
+    """Pull raw title, content, headings and links out of a page with selectolax"""
+    from selectolax.lexbor import LexborHTMLParser
+    
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(REMOVED_TAGS)
+    
+    title = tree.css_first('title')
+    title_text = title.text().strip() if title else "No Title"
+    
+    main_content = ""
+    for selector in CONTENT_SELECTORS:
+        content_elem = tree.css_first(selector)
+        if content_elem:
+            main_content = content_elem.text()
+            break
+    
+    if not main_content and tree.body:
+        # Fallback to body content
+        main_content = tree.body.text()
+    
+    headings = [(node.tag, node.text()) for node in tree.css(', '.join(HEADING_TAGS))]
+    links = [(node.attributes.get('href') or '', node.text()) for node in tree.css('a[href]')]
+    return title_text, main_content, headings, links
+
+class CrawlState:
+    """Per-URL validators, content hashes and derived facts and examples remembered between crawls"""
+    
+    def __init__(self, path: str = "crawl_state.json"):
+        self.path = path
+        self.pages: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.pages = json.load(f)
+    
+    def get(self, url: str) -> Dict:
+        """Get the stored state for a URL"""
+        return self.pages.get(url, {})
+    
+    def update(self, url: str, **fields):
+        """Merge fields into the stored state for a URL"""
+        self.pages.setdefault(url, {}).update(fields)
+    
+    def remove(self, url: str):
+        """Forget a URL"""
+        self.pages.pop(url, None)
+    
+    def save(self):
+        """Write the state file atomically"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.pages, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+def content_hash(data) -> str:
+    """Hash page bytes or text for change detection"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
 
 class WebsiteScraper:
     """Scraper for extracting content from kiatechsoftware.com"""
     
-    def __init__(self, base_url: str = "https://www.kiatechsoftware.com"):
-        self.base_url = base_url
+    def __init__(self, base_url: str = "https://www.kiatechsoftware.com", seed_paths: List[str] = None,
+                 crawl_state: CrawlState = None, parser_backend: str = 'html.parser'):
+        if parser_backend not in available_parser_backends():
+            print(f"Parser backend '{parser_backend}' is not installed, using html.parser")
+            parser_backend = 'html.parser'
+        self.base_url = base_url.rstrip('/')
+        self.parser_backend = parser_backend
         self.domain = urlparse(base_url).netloc
+        self.seed_paths = DEFAULT_SEED_PATHS if seed_paths is None else seed_paths
+        self.crawl_state = crawl_state  # Enables conditional requests and change detection
         self.visited_urls: Set[str] = set()
         self.scraped_content: List[Dict] = []
+        self.unchanged_urls: List[str] = []
+        self.gone_urls: List[str] = []
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': USER_AGENT
         })
     
+    def seed_urls(self) -> List[str]:
+        """Get the URLs a crawl starts from"""
+        return [self.base_url] + [f"{self.base_url}{path}" for path in self.seed_paths]
+    
     def is_valid_url(self, url: str) -> bool:
         """Check if URL is valid and belongs to our domain"""
-        try:
-            parsed = urlparse(url)
-            return (
-                parsed.netloc == self.domain and
-                not any(ext in url.lower() for ext in ['.pdf', '.jpg', '.png', '.gif', '.css', '.js', '.xml', '.zip']) and
-                '#' not in url
-            )
-        except:
-            return False
+        return is_valid_url(url, self.domain)
     
     def clean_text(self, text: str) -> str:
         """Clean and normalize text content"""
-        if not text:
-            return ""
-        
-        # Remove extra whitespace and normalize
-        text = re.sub(r'\s+', ' ', text.strip())
-        
-        # Remove common navigation and footer text
-        unwanted_patterns = [
-            r'cookie policy',
-            r'privacy policy',
-            r'terms of service',
-            r'follow us on',
-            r'subscribe to',
-            r'newsletter',
-            r'copyright',
-            r'all rights reserved'
-        ]
-        
-        for pattern in unwanted_patterns:
-            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
-        
-        return text.strip()
+        return clean_text(text)
     
     def extract_page_content(self, url: str) -> Dict:
         """Extract meaningful content from a webpage"""
@@ -71,95 +293,35 @@ class WebsiteScraper:
             print(f"Scraping: {url}")
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.decompose()
-            
-            # Extract title
-            title = soup.find('title')
-            title_text = title.get_text().strip() if title else "No Title"
-            
-            # Extract main content
-            content_selectors = [
-                'main', 'article', '.content', '.main-content', 
-                '.page-content', '#content', '.container'
-            ]
-            
-            main_content = ""
-            for selector in content_selectors:
-                content_elem = soup.select_one(selector)
-                if content_elem:
-                    main_content = content_elem.get_text()
-                    break
-            
-            if not main_content:
-                # Fallback to body content
-                body = soup.find('body')
-                if body:
-                    main_content = body.get_text()
-            
-            # Clean the content
-            cleaned_content = self.clean_text(main_content)
-            
-            # Extract headings for structure
-            headings = []
-            for tag in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                heading_text = self.clean_text(tag.get_text())
-                if heading_text and len(heading_text) > 3:
-                    headings.append({
-                        'level': tag.name,
-                        'text': heading_text
-                    })
-            
-            # Extract links for further crawling
-            links = []
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                full_url = urljoin(url, href)
-                if self.is_valid_url(full_url) and full_url not in self.visited_urls:
-                    link_text = self.clean_text(link.get_text())
-                    if link_text and len(link_text) > 2:
-                        links.append({
-                            'url': full_url,
-                            'text': link_text
-                        })
-            
-            return {
-                'url': url,
-                'title': title_text,
-                'content': cleaned_content,
-                'headings': headings,
-                'links': links,
-                'word_count': len(cleaned_content.split()),
-                'scraped_at': time.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
+            return self.parse_page(url, response.content)
         except Exception as e:
             print(f"Error scraping {url}: {e}")
             return None
     
+    def parse_page(self, url: str, html) -> Dict:
+        """Extract meaningful content from a downloaded page"""
+        page_data = parse_html(url, html, self.domain, self.parser_backend)
+        return self._drop_visited_links(page_data)
+    
+    def _drop_visited_links(self, page_data: Optional[Dict]) -> Optional[Dict]:
+        """Remove links to pages already crawled"""
+        if page_data:
+            page_data['links'] = [link for link in page_data['links'] if link['url'] not in self.visited_urls]
+        return page_data
+    
     def crawl_website(self, max_pages: int = 50, delay: float = 1.0) -> List[Dict]:
         """Crawl the entire website starting from base URL"""
         print(f"Starting website crawl of {self.base_url}")
         print(f"Max pages: {max_pages}, Delay: {delay}s")
         
-        # Start with base URL and add specific product pages we know about
-        urls_to_visit = [
-            self.base_url,
-            f"{self.base_url}/Home/AboutUs",
-            f"{self.base_url}/Home/ContactUs",
-            f"{self.base_url}/Product",  # EIMS product page
-            f"{self.base_url}/Home/Products",  # Products page
-            f"{self.base_url}/Home/Services",  # Services page
-            f"{self.base_url}/Home/Portfolio",  # Portfolio page
-        ]
+        # Start with base URL and add specific product pages we know about;
+        # the deque and set keep queueing and membership checks O(1)
+        urls_to_visit = deque(self.seed_urls())
+        queued_urls = set(urls_to_visit)
         self.scraped_content = []
         
         while urls_to_visit and len(self.scraped_content) < max_pages:
-            current_url = urls_to_visit.pop(0)
+            current_url = urls_to_visit.popleft()
             
             if current_url in self.visited_urls:
                 continue
@@ -174,8 +336,9 @@ class WebsiteScraper:
                 
                 # Add new links to visit
                 for link in page_data['links']:
-                    if link['url'] not in self.visited_urls and link['url'] not in urls_to_visit:
+                    if link['url'] not in self.visited_urls and link['url'] not in queued_urls:
                         urls_to_visit.append(link['url'])
+                        queued_urls.add(link['url'])
                 
                 print(f"✓ Scraped: {page_data['title']} ({page_data['word_count']} words)")
             
@@ -185,6 +348,155 @@ class WebsiteScraper:
         print(f"\nCrawl complete! Scraped {len(self.scraped_content)} pages")
         return self.scraped_content
     
+    async def crawl_website_async(self, max_pages: int = 50, concurrency: int = 5, per_host_delay: float = 0.25,
+                                  max_per_host: int = 2, timeout: float = 10.0, parse_workers: int = 0) -> List[Dict]:
+        """Crawl the website with a pool of concurrent workers and per-host politeness limits
+        
+        With parse_workers > 0, HTML parsing runs in a process pool so it no
+        longer competes with the fetch workers for the event loop.
+        """
+        print(f"Starting async website crawl of {self.base_url}")
+        print(f"Max pages: {max_pages}, Workers: {concurrency}, Per-host delay: {per_host_delay}s, "
+              f"Parser: {self.parser_backend}, Parse processes: {parse_workers or 'inline'}")
+        self._parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+        
+        # asyncio.Queue is deque-backed; queued_urls makes the frontier check O(1)
+        frontier: asyncio.Queue = asyncio.Queue()
+        queued_urls: Set[str] = set()
+        for url in self.seed_urls():
+            if url not in queued_urls:
+                queued_urls.add(url)
+                frontier.put_nowait(url)
+        
+        self.scraped_content = []
+        self.unchanged_urls = []
+        self.gone_urls = []
+        pages_crawled = 0
+        limiter = HostRateLimiter(min_interval=per_host_delay, max_per_host=max_per_host)
+        
+        async with httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=concurrency)
+        ) as client:
+            
+            async def worker():
+                nonlocal pages_crawled
+                while True:
+                    url = await frontier.get()
+                    try:
+                        if url in self.visited_urls or pages_crawled >= max_pages:
+                            continue
+                        self.visited_urls.add(url)
+                        
+                        page_data = await self._fetch_and_parse(client, limiter, url)
+                        if not page_data or pages_crawled >= max_pages:
+                            continue
+                        
+                        if page_data.get('unchanged'):
+                            self.unchanged_urls.append(url)
+                            print(f"= Unchanged: {url}")
+                        elif page_data['content']:
+                            self.scraped_content.append(page_data)
+                            print(f"✓ Scraped: {page_data['title']} ({page_data['word_count']} words)")
+                        else:
+                            continue
+                        pages_crawled += 1
+                        
+                        for link in page_data['links']:
+                            if link['url'] not in self.visited_urls and link['url'] not in queued_urls:
+                                queued_urls.add(link['url'])
+                                frontier.put_nowait(link['url'])
+                    finally:
+                        frontier.task_done()
+            
+            workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+            try:
+                await frontier.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                if self._parse_pool:
+                    self._parse_pool.shutdown()
+                    self._parse_pool = None
+        
+        print(f"\nCrawl complete! Scraped {len(self.scraped_content)} pages")
+        return self.scraped_content
+    
+    async def _fetch_and_parse(self, client: httpx.AsyncClient, limiter: HostRateLimiter, url: str) -> Optional[Dict]:
+        """Download a page under the host's politeness limits and parse it
+        
+        With a crawl state, the request is conditional and pages whose
+        content has not changed come back as {'unchanged': True} markers
+        carrying the links remembered from the previous crawl.
+        """
+        previous = self.crawl_state.get(url) if self.crawl_state else {}
+        headers = {}
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+        
+        host = urlparse(url).netloc
+        await limiter.acquire(host)
+        try:
+            print(f"Scraping: {url}")
+            response = await client.get(url, headers=headers)
+            if response.status_code in (404, 410) and previous:
+                self.gone_urls.append(url)
+                return None
+            if response.status_code == 304 and previous:
+                return self._unchanged_page(url, previous)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Error scraping {url}: {e}")
+            return None
+        finally:
+            limiter.release(host)
+        
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body_hash': content_hash(response.content)
+        }
+        
+        # Identical bytes need no parsing at all
+        if previous and validators['body_hash'] == previous.get('body_hash'):
+            return self._unchanged_page(url, previous, validators)
+        
+        # All links are kept here; the frontier skips visited ones itself
+        page_data = await self._parse_async(url, response.content)
+        if not page_data:
+            return None
+        page_data.update(validators)
+        page_data['content_hash'] = content_hash(page_data['content'])
+        
+        # Markup can change (tokens, timestamps) while the extracted text stays the same
+        if previous and page_data['content_hash'] == previous.get('content_hash'):
+            validators['links'] = [link['url'] for link in page_data['links']]
+            return self._unchanged_page(url, previous, validators)
+        return page_data
+    
+    async def _parse_async(self, url: str, html) -> Optional[Dict]:
+        """Parse a page in the process pool when one is configured, otherwise inline"""
+        if self._parse_pool is None:
+            return parse_html(url, html, self.domain, self.parser_backend)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._parse_pool, parse_html, url, html, self.domain, self.parser_backend)
+    
+    def _unchanged_page(self, url: str, previous: Dict, validators: Dict = None) -> Dict:
+        """Record fresh validators for an unchanged page and return its marker"""
+        if validators:
+            self.crawl_state.update(url, **{key: value for key, value in validators.items() if value is not None})
+        links = self.crawl_state.get(url).get('links', [])
+        return {
+            'url': url,
+            'unchanged': True,
+            'links': [{'url': link} for link in links if self.is_valid_url(link)]
+        }
+    
     def save_scraped_data(self, filename: str = "website_content.json"):
         """Save scraped data to JSON file"""
         with open(filename, 'w', encoding='utf-8') as f:
@@ -227,61 +539,146 @@ class WebsiteScraper:
 class WebsiteTrainer:
     """Trainer for converting website content into chatbot knowledge"""
     
-    def __init__(self, knowledge_base: KnowledgeBase = None):
+    def __init__(self, knowledge_base: KnowledgeBase = None, max_passage_chars: int = 800, passage_overlap: int = 150):
         self.knowledge_base = knowledge_base or KnowledgeBase()
+        self.max_passage_chars = max_passage_chars
+        self.passage_overlap = passage_overlap
     
     def process_scraped_content(self, scraped_data: List[Dict]) -> Dict:
         """Process scraped content and add to knowledge base"""
         print("Processing scraped content for chatbot training...")
         
-        facts = []
+        passages_added = 0
         example_conversations = []
         product_info = []
         
-        for page in scraped_data:
-            url = page['url']
-            title = page['title']
-            content = page['content']
-            
-            # Extract facts from content
-            if content and len(content) > 50:
-                facts.append(f"From {title}: {content[:500]}...")
-            
-            # Create example conversations based on page content
-            if '/product' in url.lower() or '/service' in url.lower():
-                # Extract product/service information
-                product_info.append({
-                    'title': title,
-                    'url': url,
-                    'content': content[:1000]  # First 1000 chars
-                })
+        # One journal write, and other processes' knowledge base writes wait until the passages are saved
+        with self.knowledge_base.batch():
+            for page in scraped_data:
+                url = page['url']
+                title = page['title']
+                content = page['content']
+                
+                # Split the whole page into retrievable passages
+                passages_added += self.knowledge_base.passages.replace_page(url, self._page_passages(page))
                 
-                # Create example Q&A pairs
-                example_conversations.extend(self._create_product_examples(title, content))
+                # Create example conversations based on page content
+                if '/product' in url.lower() or '/service' in url.lower():
+                    # Extract product/service information
+                    product_info.append({
+                        'title': title,
+                        'url': url,
+                        'content': content[:1000]  # First 1000 chars
+                    })
+                    
+                    # Create example Q&A pairs
+                    example_conversations.extend(self._create_product_examples(title, content))
+                
+                elif '/about' in url.lower():
+                    # Create about company examples
+                    example_conversations.extend(self._create_about_examples(content))
             
-            elif '/about' in url.lower():
-                # Create about company examples
-                example_conversations.extend(self._create_about_examples(content))
-        
-        # Add processed content to knowledge base
-        for fact in facts:
-            self.knowledge_base.add_fact(fact)
+            # Add processed content to knowledge base
+            for conversation in example_conversations:
+                self.knowledge_base.add_example_conversation(
+                    conversation['user'],
+                    conversation['assistant']
+                )
+            self.knowledge_base.passages.save()
         
-        for conversation in example_conversations:
-            self.knowledge_base.add_example_conversation(
-                conversation['user'],
-                conversation['assistant']
-            )
-        
-        # Knowledge base auto-saves when adding content
+        # Embedded here, so the server never has to on a chat request
+        self.knowledge_base.sync_vectors()
         
         return {
-            'facts_added': len(facts),
+            'passages_added': passages_added,
             'conversations_added': len(example_conversations),
             'products_processed': len(product_info),
             'product_info': product_info
         }
     
+    def apply_incremental_update(self, changed_pages: List[Dict], crawl_state: CrawlState, gone_urls: List[str] = None) -> Dict:
+        """Re-chunk only the changed pages and retire passages from removed pages"""
+        print("Applying incremental update to the knowledge base...")
+        
+        passages_added = 0
+        facts_removed = 0
+        conversations_added = 0
+        conversations_removed = 0
+        passages = self.knowledge_base.passages
+        
+        with self.knowledge_base.batch():
+            for url in gone_urls or []:
+                passages.remove_page(url)
+                facts_removed += self._retire_page_facts(crawl_state.get(url))
+                conversations_removed += self._retire_page_examples(url, crawl_state, keep=[])
+                crawl_state.remove(url)
+                print(f"✗ Retired: {url}")
+            
+            for page in changed_pages:
+                url = page['url']
+                # Pages trained before passages existed still own a truncated page fact
+                facts_removed += self._retire_page_facts(crawl_state.get(url))
+                passages_added += passages.replace_page(url, self._page_passages(page))
+                
+                examples = [[conversation['user'], conversation['assistant']] for conversation in self._page_examples(page)]
+                conversations_removed += self._retire_page_examples(url, crawl_state, keep=examples)
+                for user_message, assistant_response in examples:
+                    self.knowledge_base.add_example_conversation(user_message, assistant_response)
+                conversations_added += len(examples)
+                
+                crawl_state.update(
+                    url,
+                    etag=page.get('etag'),
+                    last_modified=page.get('last_modified'),
+                    body_hash=page.get('body_hash'),
+                    content_hash=page.get('content_hash') or content_hash(page['content']),
+                    links=[link['url'] for link in page['links']],
+                    facts=[],  # Page text lives in passages now, so a page derives no facts
+                    examples=examples,
+                    crawled_at=page['scraped_at']
+                )
+            passages.save()
+        
+        crawl_state.save()
+        self.knowledge_base.sync_vectors()
+        return {
+            'pages_changed': len(changed_pages),
+            'pages_retired': len(gone_urls or []),
+            'passages_added': passages_added,
+            'facts_removed': facts_removed,
+            'conversations_added': conversations_added,
+            'conversations_removed': conversations_removed
+        }
+    
+    def _retire_page_facts(self, state: Dict) -> int:
+        """Remove the facts a page contributed to the knowledge base"""
+        return sum(self.knowledge_base.remove_fact(fact) for fact in state.get('facts', []))
+    
+    def _retire_page_examples(self, url: str, crawl_state: CrawlState, keep: List[List[str]]) -> int:
+        """Remove the examples a page derived last time that it no longer derives and no other page still does"""
+        still_derived = {tuple(example) for example in keep}
+        for other_url, state in crawl_state.pages.items():
+            if other_url != url:
+                still_derived.update(tuple(example) for example in state.get('examples', []))
+        return sum(
+            self.knowledge_base.remove_example_conversation(user_message, assistant_response)
+            for user_message, assistant_response in crawl_state.get(url).get('examples', [])
+            if (user_message, assistant_response) not in still_derived
+        )
+    
+    def _page_passages(self, page: Dict):
+        """Chunk a scraped page into heading-aware, overlapping passages"""
+        return chunk_page(page, max_chars=self.max_passage_chars, overlap=self.passage_overlap)
+    
+    def _page_examples(self, page: Dict) -> List[Dict]:
+        """Derive example conversations from a scraped page"""
+        url = page['url'].lower()
+        if '/product' in url or '/service' in url:
+            return self._create_product_examples(page['title'], page['content'])
+        if '/about' in url:
+            return self._create_about_examples(page['content'])
+        return []
+    
     def _create_product_examples(self, title: str, content: str) -> List[Dict]:
         """Create example conversations for product pages"""
         examples = []
@@ -315,14 +712,42 @@ class WebsiteTrainer:
 
 def main():
     """Main function to scrape website and train chatbot"""
+    parser = argparse.ArgumentParser(description="Scrape the company website and train the chatbot")
+    parser.add_argument("--base-url", default="https://www.kiatechsoftware.com", help="Site to crawl")
+    parser.add_argument("--max-pages", type=int, default=30, help="Maximum number of pages to scrape")
+    parser.add_argument("--sync", action="store_true", help="Crawl one page at a time instead of concurrently")
+    parser.add_argument("--concurrency", type=int, default=5, help="Concurrent fetch workers in async mode")
+    parser.add_argument("--delay", type=float, default=None,
+                        help="Seconds between requests to the same host (default 1.0 sync, 0.25 async)")
+    parser.add_argument("--parser", default="html.parser", choices=["html.parser", "lxml", "selectolax"],
+                        help="HTML parser backend (lxml and selectolax must be installed separately)")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="Processes used for HTML parsing in async mode (0 parses inline)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-train on pages that changed since the last incremental crawl")
+    parser.add_argument("--state-file", default="crawl_state.json", help="Crawl state used by --incremental")
+    args = parser.parse_args()
+    
     print("🚀 Kiatech Software Website Scraper & Trainer")
     print("=" * 60)
     
+    if args.incremental:
+        run_incremental(args)
+        return
+    
     # Initialize scraper
-    scraper = WebsiteScraper("https://www.kiatechsoftware.com")
+    scraper = WebsiteScraper(args.base_url, parser_backend=args.parser)
     
     # Crawl website
-    scraped_data = scraper.crawl_website(max_pages=30, delay=1.0)
+    if args.sync:
+        scraped_data = scraper.crawl_website(max_pages=args.max_pages, delay=1.0 if args.delay is None else args.delay)
+    else:
+        scraped_data = asyncio.run(scraper.crawl_website_async(
+            max_pages=args.max_pages,
+            concurrency=args.concurrency,
+            per_host_delay=0.25 if args.delay is None else args.delay,
+            parse_workers=args.parse_workers
+        ))
     
     if not scraped_data:
         print("❌ No content scraped. Please check the website URL.")
@@ -343,12 +768,36 @@ def main():
     training_results = trainer.process_scraped_content(scraped_data)
     
     print(f"\n🎓 Training Results:")
-    print(f"Facts added: {training_results['facts_added']}")
+    print(f"Passages added: {training_results['passages_added']}")
     print(f"Example conversations added: {training_results['conversations_added']}")
     print(f"Products processed: {training_results['products_processed']}")
     
     print(f"\n✅ Website training complete!")
     print(f"Your chatbot now knows about your website content!")
 
+def run_incremental(args):
+    """Re-crawl with conditional requests and update only what changed"""
+    crawl_state = CrawlState(args.state_file)
+    scraper = WebsiteScraper(args.base_url, crawl_state=crawl_state, parser_backend=args.parser)
+    
+    changed_pages = asyncio.run(scraper.crawl_website_async(
+        max_pages=args.max_pages,
+        concurrency=args.concurrency,
+        per_host_delay=0.25 if args.delay is None else args.delay,
+        parse_workers=args.parse_workers
+    ))
+    
+    trainer = WebsiteTrainer()
+    results = trainer.apply_incremental_update(changed_pages, crawl_state, scraper.gone_urls)
+    
+    print(f"\n🔄 Incremental Update:")
+    print(f"Pages unchanged: {len(scraper.unchanged_urls)}")
+    print(f"Pages changed or new: {results['pages_changed']}")
+    print(f"Pages retired: {results['pages_retired']}")
+    print(f"Passages added: {results['passages_added']}")
+    print(f"Facts removed: {results['facts_removed']}")
+    print(f"Example conversations added: {results['conversations_added']}")
+    print(f"Example conversations removed: {results['conversations_removed']}")
+
 if __name__ == "__main__":
     main()